@@ -5,7 +5,7 @@
 
 from typing import Dict, List, Optional
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, select
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from models import Base, User
@@ -24,6 +24,10 @@ class ChatMessage(Base):
     
     # 关系
     user = relationship("User")
+    
+    __table_args__ = (
+        Index("ix_chat_messages_user_session_created", "user_id", "session_id", "created_at"),
+    )
 
 # 聊天历史管理类
 class ChatHistoryManager:
@@ -6,13 +6,18 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 import asyncio
 import platform
-from models import Base, async_engine
+from models import async_engine
+from migrations import run_migrations
+from services import password_hasher, presence_manager, mail_queue, user_search, message_search, friend_graph, connection_hub, event_bus, message_writer, message_purge
 from routes import (
     auth_router, 
     registration_router, 
     verification_router, 
     users_router,
     chat_router,
+    system_router,
+    presence_router,
+    realtime_router,
 )
 from AIservices import (
     aiyasaxi_router,
@@ -34,11 +39,32 @@ async def lifespan(app: FastAPI):
             asyncio.set_event_loop(asyncio.ProactorEventLoop())
             print("已设置ProactorEventLoop用于Windows环境")
     
-    # 启动时初始化数据库表
+    # 启动时执行尚未执行的数据库迁移
     async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+        await user_search.check(conn)
+        await message_search.check(conn)
+        # 构建内存中的好友关系图
+        await friend_graph.load(conn)
+    
+    # 启动在线状态批量写回任务和邮件发送任务
+    presence_manager.start()
+    mail_queue.start()
+    # 启动跨进程事件分发
+    await event_bus.start()
+    # 启动消息组提交写入任务（仅 batch 模式）
+    message_writer.start()
+    # 继续上次未完成的消息清理
+    await message_purge.start()
     yield
     print("正在关闭服务...")
+    await message_purge.stop()
+    await message_writer.stop()
+    await event_bus.stop()
+    await connection_hub.close_all()
+    await presence_manager.stop()
+    await mail_queue.stop()
+    password_hasher.shutdown()
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -54,6 +80,9 @@ app.include_router(registration_router, prefix="/api/v1")
 app.include_router(verification_router, prefix="/api/v1")
 app.include_router(users_router, prefix="/api/v1")
 app.include_router(chat_router, prefix="/api/v1")
+app.include_router(system_router, prefix="/api/v1")
+app.include_router(presence_router, prefix="/api/v1")
+app.include_router(realtime_router, prefix="/api/v1")
 app.include_router(aiyasaxi_router, prefix="/api/v1")
 app.include_router(tools_router, prefix="/api/v1")
 app.include_router(weather_router, prefix="/api/v1")
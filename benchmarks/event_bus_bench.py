@@ -0,0 +1,105 @@
+"""
+事件总线性能测试
+一个发布进程通过 SQLite 追加日志向多个订阅进程（模拟 uvicorn 工作进程）发布事件，测试发布、写入吞吐和跨进程投递延迟
+用法: python -m benchmarks.event_bus_bench [--events 20000] [--workers 3] [--rate 0]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from services.event_bus import LocalEventBus, SQLiteLogEventBus
+
+def _percentile(values, percent: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+async def _subscribe(path: str, events: int, poll_interval: float, ready, results) -> None:
+    """订阅进程：记录每个事件从发布到投递的延迟"""
+    latencies = []
+    bus = SQLiteLogEventBus(
+        lambda user_ids, event: latencies.append(time.time() - event["ts"]),
+        path=path,
+        poll_interval=poll_interval
+    )
+    await bus.start()
+    ready.set()
+    deadline = time.monotonic() + 60
+    while len(latencies) < events and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    await bus.stop()
+    results.put((os.getpid(), len(latencies), latencies))
+
+def _subscriber(path: str, events: int, poll_interval: float, ready, results) -> None:
+    asyncio.run(_subscribe(path, events, poll_interval, ready, results))
+
+async def _publish(path: str, events: int, rate: float, poll_interval: float) -> None:
+    """发布进程：按指定速率发布事件（0 表示尽快发布）"""
+    bus = SQLiteLogEventBus(lambda user_ids, event: None, path=path, poll_interval=poll_interval)
+    await bus.start()
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+    for index in range(events):
+        bus.publish([1, 2], {"type": "message.new", "ts": time.time(), "seq": index, "content": "x" * 64})
+        if interval:
+            await asyncio.sleep(interval)
+        elif index % 100 == 99:
+            # 让出事件循环，模拟请求处理之间的间隙
+            await asyncio.sleep(0)
+    publish_elapsed = time.perf_counter() - start
+    while bus.written < events:
+        await asyncio.sleep(0.005)
+    write_elapsed = time.perf_counter() - start
+    await bus.stop()
+    print(f"发布 {events} 个事件: {publish_elapsed * 1000:.1f} ms ({events / publish_elapsed:,.0f} 个/秒)")
+    print(f"全部写入日志: {write_elapsed * 1000:.1f} ms ({events / write_elapsed:,.0f} 个/秒)")
+
+def main(events: int, workers: int, rate: float, poll_interval: float) -> None:
+    # 进程内后端作为基准（只包含投递函数调用的开销）
+    local = LocalEventBus(lambda user_ids, event: None)
+    start = time.perf_counter()
+    for index in range(events):
+        local.publish([1, 2], {"type": "message.new", "seq": index})
+    elapsed = time.perf_counter() - start
+    print(f"进程内后端发布 {events} 个事件: {elapsed * 1000:.1f} ms ({events / elapsed:,.0f} 个/秒)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "event_bus.db")
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        readies = [context.Event() for _ in range(workers)]
+        processes = [
+            context.Process(target=_subscriber, args=(path, events, poll_interval, ready, results))
+            for ready in readies
+        ]
+        for process in processes:
+            process.start()
+        # 等待订阅进程建表并记录起始位置
+        for ready in readies:
+            ready.wait(30)
+
+        print(f"SQLite 日志后端: {workers} 个订阅进程, 轮询间隔 {poll_interval * 1000:.0f} ms")
+        asyncio.run(_publish(path, events, rate, poll_interval))
+
+        for _ in processes:
+            pid, received, latencies = results.get(timeout=90)
+            print(
+                f"订阅进程 {pid}: 收到 {received}/{events}, 延迟 p50 {_percentile(latencies, 50) * 1000:.1f} ms"
+                f"  p99 {_percentile(latencies, 99) * 1000:.1f} ms  最大 {max(latencies, default=0) * 1000:.1f} ms"
+            )
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="事件总线性能测试")
+    parser.add_argument("--events", type=int, default=20000, help="事件数")
+    parser.add_argument("--workers", type=int, default=3, help="订阅进程数")
+    parser.add_argument("--rate", type=float, default=0, help="每秒发布的事件数，0 表示尽快发布")
+    parser.add_argument("--poll-interval", type=float, default=0.02, help="轮询日志的间隔（秒）")
+    args = parser.parse_args()
+    main(args.events, args.workers, args.rate, args.poll_interval)
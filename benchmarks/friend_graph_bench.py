@@ -0,0 +1,51 @@
+"""
+好友关系图性能测试
+在随机生成的 100 万条边的图上测试构建、共同好友数、好友推荐和增量更新的耗时
+用法: python -m benchmarks.friend_graph_bench [--users 100000] [--edges 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.friend_graph import FriendGraph
+
+def _timeit(label: str, func, count: int = 1):
+    """执行并打印总耗时和单次操作的平均耗时"""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} 总计 {elapsed * 1000:10.2f} ms    平均 {elapsed / count * 1e6:10.2f} us")
+    return result
+
+def main(users: int, edges: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    src = rng.integers(1, users + 1, size=edges)
+    dst = rng.integers(1, users + 1, size=edges)
+    print(f"随机图: {users} 个用户, {edges} 条边")
+
+    graph = _timeit("构建 CSR", lambda: FriendGraph.from_edges(src, dst, compact_threshold=10 ** 9))
+    print(f"去重后: {graph.stats()}")
+
+    pairs = rng.integers(1, users + 1, size=(10000, 2))
+    _timeit("共同好友数 x10000", lambda: [graph.mutual_count(int(a), int(b)) for a, b in pairs], 10000)
+
+    sample = rng.integers(1, users + 1, size=1000)
+    _timeit("批量共同好友数(50) x1000", lambda: [
+        graph.mutual_counts(int(uid), sample[:50].tolist()) for uid in sample
+    ], 1000)
+    _timeit("好友推荐 top10 x1000", lambda: [graph.suggest(int(uid), 10) for uid in sample], 1000)
+
+    updates = rng.integers(1, users + 1, size=(10000, 2))
+    _timeit("增量加好友 x10000", lambda: [graph.add_friendship(int(a), int(b)) for a, b in updates], 10000)
+    _timeit("带增量层的推荐 x1000", lambda: [graph.suggest(int(uid), 10) for uid in sample], 1000)
+    _timeit("合并增量层", graph.compact)
+    _timeit("合并后的推荐 x1000", lambda: [graph.suggest(int(uid), 10) for uid in sample], 1000)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="好友关系图性能测试")
+    parser.add_argument("--users", type=int, default=100000, help="用户数")
+    parser.add_argument("--edges", type=int, default=1000000, help="边数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+    main(args.users, args.edges, args.seed)
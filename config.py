@@ -2,9 +2,78 @@
 配置模块
 存储应用程序的配置变量
 """
+import os
 import secrets
 
 # JWT配置
-SECRET_KEY = secrets.token_urlsafe(32)  # 生成安全的随机密钥
+SECRET_KEY = os.environ.get("SECRET_KEY") or secrets.token_urlsafe(32)  # 多工作进程部署时须通过环境变量指定同一密钥
 ALGORITHM = "HS256"  # JWT加密算法
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 访问令牌过期时间（分钟）
+
+# 令牌-用户缓存配置
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", "10000"))  # 最多缓存的令牌数
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))  # 缓存条目存活时间（秒）
+
+# 密码哈希执行器配置
+PASSWORD_HASHER_KIND = os.environ.get("PASSWORD_HASHER_KIND", "thread")  # thread 或 process
+PASSWORD_HASHER_WORKERS = int(os.environ.get("PASSWORD_HASHER_WORKERS", str(os.cpu_count() or 1)))  # 工作线程/进程数
+PASSWORD_HASHER_MAX_PENDING = int(os.environ.get("PASSWORD_HASHER_MAX_PENDING", "64"))  # 等待中任务上限，超出时立即拒绝
+
+# 在线状态配置
+PRESENCE_TTL_SECONDS = int(os.environ.get("PRESENCE_TTL_SECONDS", "120"))  # 超过该时间无心跳视为离线
+PRESENCE_FLUSH_INTERVAL_SECONDS = int(os.environ.get("PRESENCE_FLUSH_INTERVAL_SECONDS", "15"))  # 批量写回数据库的间隔
+
+# 验证码存储配置
+VERIFICATION_BACKEND = os.environ.get("VERIFICATION_BACKEND", "memory")  # memory 或 sqlite（多工作进程共享）
+VERIFICATION_DB_PATH = os.environ.get("VERIFICATION_DB_PATH", "./verification_codes.db")  # sqlite 后端的文件路径
+VERIFICATION_CODE_TTL_SECONDS = int(os.environ.get("VERIFICATION_CODE_TTL_SECONDS", "60"))  # 验证码有效期（秒）
+VERIFICATION_MAX_ATTEMPTS = int(os.environ.get("VERIFICATION_MAX_ATTEMPTS", "5"))  # 每个验证码允许的失败次数
+VERIFICATION_MAX_ENTRIES = int(os.environ.get("VERIFICATION_MAX_ENTRIES", "100000"))  # 最多保存的验证码数量
+
+# 邮件发送配置（未配置 SMTP_HOST 时验证码直接在响应中返回）
+SMTP_HOST = os.environ.get("SMTP_HOST")  # SMTP服务器地址
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))  # SMTP服务器端口
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")  # SMTP登录用户名
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")  # SMTP登录密码
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "false").lower() == "true"  # 是否使用STARTTLS
+MAIL_FROM = os.environ.get("MAIL_FROM", "noreply@azyasaxi.local")  # 发件人地址
+MAIL_QUEUE_MAX_SIZE = int(os.environ.get("MAIL_QUEUE_MAX_SIZE", "10000"))  # 邮件队列容量
+MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", "50"))  # 每批通过同一连接发送的邮件数
+MAIL_MAX_RETRIES = int(os.environ.get("MAIL_MAX_RETRIES", "5"))  # 发送失败后的最大重试次数
+MAIL_RETRY_BASE_DELAY_SECONDS = float(os.environ.get("MAIL_RETRY_BASE_DELAY_SECONDS", "1"))  # 首次重试延迟，之后指数增长
+MAIL_CONNECTION_IDLE_SECONDS = float(os.environ.get("MAIL_CONNECTION_IDLE_SECONDS", "30"))  # SMTP连接空闲多久后关闭
+
+# 批量导入用户配置
+USER_IMPORT_CHUNK_SIZE = int(os.environ.get("USER_IMPORT_CHUNK_SIZE", "1000"))  # 每个事务写入的用户数
+
+# 用户列表配置
+USER_LIST_BATCH_SIZE = int(os.environ.get("USER_LIST_BATCH_SIZE", "500"))  # /users/all 每次从数据库读取的用户数
+
+# 好友关系缓存配置
+FRIENDSHIP_CACHE_MAX_USERS = int(os.environ.get("FRIENDSHIP_CACHE_MAX_USERS", "10000"))  # 最多缓存多少个用户的好友集合
+
+# 好友关系图配置
+FRIEND_GRAPH_COMPACT_THRESHOLD = int(os.environ.get("FRIEND_GRAPH_COMPACT_THRESHOLD", "10000"))  # 增量变更达到多少次后合并回CSR数组
+
+# 实时推送配置
+REALTIME_QUEUE_SIZE = int(os.environ.get("REALTIME_QUEUE_SIZE", "256"))  # 每个WebSocket连接最多积压的事件数，超出时断开该连接
+REALTIME_SEND_TIMEOUT_SECONDS = float(os.environ.get("REALTIME_SEND_TIMEOUT_SECONDS", "10"))  # 单个事件的发送超时
+
+# 事件总线配置（多个工作进程部署时使用 sqlite 后端，在进程间分发聊天事件和缓存失效通知）
+EVENT_BUS_BACKEND = os.environ.get("EVENT_BUS_BACKEND", "local")  # local 或 sqlite
+EVENT_BUS_DB_PATH = os.environ.get("EVENT_BUS_DB_PATH", "./event_bus.db")  # sqlite 后端的日志文件路径
+EVENT_BUS_POLL_INTERVAL_SECONDS = float(os.environ.get("EVENT_BUS_POLL_INTERVAL_SECONDS", "0.02"))  # 轮询日志的间隔，即跨进程投递的最大额外延迟
+EVENT_BUS_BATCH_SIZE = int(os.environ.get("EVENT_BUS_BATCH_SIZE", "500"))  # 每次从日志读取的事件数
+EVENT_BUS_RETENTION_SECONDS = float(os.environ.get("EVENT_BUS_RETENTION_SECONDS", "60"))  # 日志中事件的保留时间
+
+# 消息写入配置（batch 模式下多个请求的消息合并在一个事务中提交）
+MESSAGE_WRITE_MODE = os.environ.get("MESSAGE_WRITE_MODE", "direct")  # direct 或 batch
+MESSAGE_WRITE_BATCH_SIZE = int(os.environ.get("MESSAGE_WRITE_BATCH_SIZE", "100"))  # 每个事务最多写入的消息数
+MESSAGE_WRITE_MAX_DELAY_SECONDS = float(os.environ.get("MESSAGE_WRITE_MAX_DELAY_SECONDS", "0.005"))  # 攒批的最长等待时间
+MESSAGE_WRITE_MAX_PENDING = int(os.environ.get("MESSAGE_WRITE_MAX_PENDING", "10000"))  # 等待写入的消息上限，超出时返回503
+MESSAGE_WRITE_MAX_RETRIES = int(os.environ.get("MESSAGE_WRITE_MAX_RETRIES", "3"))  # 数据库被锁时一批消息的最大重试次数
+MESSAGE_WRITE_RETRY_BASE_DELAY_SECONDS = float(os.environ.get("MESSAGE_WRITE_RETRY_BASE_DELAY_SECONDS", "0.05"))  # 重试的基础延迟，按指数递增
+
+# 消息清理配置（清空聊天记录后由后台任务分批删除）
+MESSAGE_PURGE_BATCH_SIZE = int(os.environ.get("MESSAGE_PURGE_BATCH_SIZE", "500"))  # 每个事务删除的消息数
+MESSAGE_PURGE_INTERVAL_SECONDS = float(os.environ.get("MESSAGE_PURGE_INTERVAL_SECONDS", "0.05"))  # 两批之间的暂停时间，让其他请求获得写锁
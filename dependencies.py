@@ -8,12 +8,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
+from typing import Optional
 
 from models import User, UserProfile, AsyncSessionLocal
 from config import SECRET_KEY, ALGORITHM
+from services import user_cache, presence_manager
 
 # OAuth2密码授权方案
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/token")
+# 可选认证方案（未携带令牌时不报错）
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/token", auto_error=False)
 
 async def get_db() -> AsyncSession:
     """
@@ -31,6 +35,46 @@ async def get_db() -> AsyncSession:
         finally:
             await db.close()
 
+async def authenticate_token(token: str, db: AsyncSession) -> Optional[User]:
+    """
+    校验JWT令牌并获取对应的用户（HTTP依赖和WebSocket连接共用）
+    :param token: JWT令牌
+    :param db: 数据库会话
+    :return: 用户对象，令牌无效或用户不存在时返回None
+    """
+    try:
+        # 解码JWT令牌
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    
+    # 优先从令牌-用户缓存获取，命中时无需查询数据库
+    snapshot = user_cache.get(token)
+    if snapshot is not None and snapshot.get("username") == username:
+        presence_manager.heartbeat(snapshot["id"])
+        return await user_cache.attach(snapshot, db)
+    
+    # 从数据库获取用户
+    result = await db.execute(
+        select(User, UserProfile)
+        .outerjoin(UserProfile)
+        .where(User.username == username)
+    )
+    user_info = result.first()
+    
+    if not user_info:
+        return None
+        
+    user, profile = user_info
+    user_cache.put(token, user, payload.get("exp"))
+    # 已认证的请求同时视为一次心跳
+    presence_manager.heartbeat(user.id)
+    
+    return user
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
@@ -43,33 +87,29 @@ async def get_current_user(
     :return: 当前用户对象
     :raises: HTTPException 如果认证失败
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无法验证凭据",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        # 解码JWT令牌
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        
-        # 从数据库获取用户
-        result = await db.execute(
-            select(User, UserProfile)
-            .outerjoin(UserProfile)
-            .where(User.username == username)
+    user = await authenticate_token(token, db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        user_info = result.first()
-        
-        if not user_info:
-            raise credentials_exception
-            
-        user, profile = user_info
-        
-        return user
-        
-    except JWTError:
-        raise credentials_exception
+    return user
+
+async def get_optional_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> Optional[User]:
+    """
+    获取当前用户（可选）的依赖函数
+    用于匿名和登录用户都可访问、登录后返回更多信息的路由
+    :param token: JWT令牌
+    :param db: 数据库会话
+    :return: 当前用户对象，未登录或令牌无效时返回None
+    """
+    if not token:
+        return None
+    try:
+        return await get_current_user(token, db)
+    except HTTPException:
+        return None
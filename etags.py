@@ -0,0 +1,56 @@
+"""
+ETag 模块
+根据数据版本号生成弱 ETag，并处理 If-None-Match 条件请求
+"""
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+def make_etag(*parts) -> str:
+    """
+    由版本号和请求参数生成弱 ETag
+    :param parts: 决定响应内容的各项数据（可JSON序列化）
+    :return: ETag 字符串，如 W/"3f2a..."
+    """
+    raw = json.dumps(parts, separators=(",", ":"), ensure_ascii=False, default=str)
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    判断请求的 If-None-Match 是否与 ETag 匹配（弱比较）
+    :param request: 请求对象
+    :param etag: 当前 ETag
+    :return: 是否匹配
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def check_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    设置响应的 ETag，条件请求命中时返回 304 响应
+    :param request: 请求对象
+    :param response: 路由注入的响应对象
+    :param etag: 当前 ETag
+    :return: 命中时的 304 响应，否则返回None，由调用方继续生成响应体
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+        )
+    return None
@@ -0,0 +1,391 @@
+"""
+数据库迁移模块
+按版本号顺序升级已有的SQLite数据库，已执行的版本记录在 schema_version 表中，启动时只执行尚未执行的迁移
+新增迁移时在 MIGRATIONS 末尾追加，版本号递增，已发布的迁移不要再修改；每个迁移都应可重复执行
+"""
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy import DateTime, bindparam, text
+
+from models import Base, Message, UserStats, backfill_email_normalized
+from services.user_search import create_user_search_index
+from services.message_search import create_message_search_index
+
+async def _table_exists(conn, table: str) -> bool:
+    """判断表是否存在"""
+    result = await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": table}
+    )
+    return result.first() is not None
+
+async def _add_columns(conn, table: str, columns: List[Tuple[str, str]]) -> None:
+    """
+    为已有的表添加缺少的列（新建的表已由 create_all 包含这些列）
+    :param table: 表名
+    :param columns: (列名, 列定义) 列表
+    """
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    existing = {row[1] for row in result}
+    for column, definition in columns:
+        if column not in existing:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+async def _initial_schema(conn) -> None:
+    """创建模型中定义的所有表（已存在的表不受影响）"""
+    await conn.run_sync(Base.metadata.create_all)
+
+async def _composite_indexes(conn) -> None:
+    """添加常用查询的组合索引，并为好友关系添加唯一约束"""
+    # 清理重复的好友关系记录（保留最早的一条），否则无法建立唯一索引
+    await conn.execute(text(
+        "DELETE FROM friendships WHERE id NOT IN ("
+        "SELECT MIN(id) FROM friendships GROUP BY user_id, friend_id)"
+    ))
+    statements = [
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_friendships_user_friend "
+        "ON friendships (user_id, friend_id)",
+        "CREATE INDEX IF NOT EXISTS ix_friend_requests_receiver_status "
+        "ON friend_requests (receiver_id, status)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_created "
+        "ON messages (conversation_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_read_sender "
+        "ON messages (conversation_id, is_read, sender_id)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+    # AI聊天记录表只在启用AI服务时存在
+    if await _table_exists(conn, "chat_messages"):
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_user_session_created "
+            "ON chat_messages (user_id, session_id, created_at)"
+        ))
+
+# 维护 user_stats 计数的触发器
+USER_STATS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS user_stats_friendships_ai AFTER INSERT ON friendships BEGIN "
+    "INSERT INTO user_stats (user_id, friends_count) VALUES (new.user_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET friends_count = friends_count + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_friendships_ad AFTER DELETE ON friendships BEGIN "
+    "UPDATE user_stats SET friends_count = MAX(friends_count - 1, 0) WHERE user_id = old.user_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_requests_ai AFTER INSERT ON friend_requests "
+    "WHEN new.status = 'pending' BEGIN "
+    "INSERT INTO user_stats (user_id, received_requests_count) VALUES (new.receiver_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET received_requests_count = received_requests_count + 1; "
+    "INSERT INTO user_stats (user_id, sent_requests_count) VALUES (new.sender_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET sent_requests_count = sent_requests_count + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_requests_au_leave AFTER UPDATE OF status ON friend_requests "
+    "WHEN old.status = 'pending' AND new.status IS NOT 'pending' BEGIN "
+    "UPDATE user_stats SET received_requests_count = MAX(received_requests_count - 1, 0) "
+    "WHERE user_id = old.receiver_id; "
+    "UPDATE user_stats SET sent_requests_count = MAX(sent_requests_count - 1, 0) "
+    "WHERE user_id = old.sender_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_requests_au_enter AFTER UPDATE OF status ON friend_requests "
+    "WHEN old.status IS NOT 'pending' AND new.status = 'pending' BEGIN "
+    "INSERT INTO user_stats (user_id, received_requests_count) VALUES (new.receiver_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET received_requests_count = received_requests_count + 1; "
+    "INSERT INTO user_stats (user_id, sent_requests_count) VALUES (new.sender_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET sent_requests_count = sent_requests_count + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_requests_ad AFTER DELETE ON friend_requests "
+    "WHEN old.status = 'pending' BEGIN "
+    "UPDATE user_stats SET received_requests_count = MAX(received_requests_count - 1, 0) "
+    "WHERE user_id = old.receiver_id; "
+    "UPDATE user_stats SET sent_requests_count = MAX(sent_requests_count - 1, 0) "
+    "WHERE user_id = old.sender_id; "
+    "END",
+]
+
+async def _pagination_counters(conn) -> None:
+    """为好友和好友申请列表的游标分页添加索引，并创建由触发器维护的 user_stats 计数表"""
+    # 旧版本的默认创建时间可能为空，补齐后才能按 (created_at, id) 分页
+    # 按 DateTime 类型绑定，与 SQLAlchemy 写入的格式（带微秒）一致，游标中的时间才能与之精确比较
+    now = bindparam("now", datetime.now(timezone.utc), type_=DateTime())
+    for table in ("friendships", "friend_requests"):
+        await conn.execute(
+            text(f"UPDATE {table} SET created_at = :now WHERE created_at IS NULL").bindparams(now)
+        )
+
+    statements = [
+        # 被 (receiver_id, status, created_at, id) 覆盖，不再需要
+        "DROP INDEX IF EXISTS ix_friend_requests_receiver_status",
+        "CREATE INDEX IF NOT EXISTS ix_friendships_user_created "
+        "ON friendships (user_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_friend_requests_receiver_status_created "
+        "ON friend_requests (receiver_id, status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_friend_requests_sender_status_created "
+        "ON friend_requests (sender_id, status, created_at, id)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+    await conn.run_sync(UserStats.__table__.create, checkfirst=True)
+    for statement in USER_STATS_TRIGGERS:
+        await conn.execute(text(statement))
+
+    # 用现有数据初始化计数（之后由触发器增量维护）
+    await conn.execute(text(
+        "INSERT OR REPLACE INTO user_stats "
+        "(user_id, friends_count, received_requests_count, sent_requests_count) "
+        "SELECT users.id, "
+        "(SELECT COUNT(*) FROM friendships WHERE friendships.user_id = users.id), "
+        "(SELECT COUNT(*) FROM friend_requests WHERE friend_requests.receiver_id = users.id "
+        "AND friend_requests.status = 'pending'), "
+        "(SELECT COUNT(*) FROM friend_requests WHERE friend_requests.sender_id = users.id "
+        "AND friend_requests.status = 'pending') "
+        "FROM users"
+    ))
+
+async def _unique_pending_requests(conn) -> None:
+    """为待处理的好友申请添加 (sender_id, receiver_id) 部分唯一索引"""
+    # 清理重复的待处理申请（保留最早的一条），否则无法建立唯一索引
+    await conn.execute(text(
+        "DELETE FROM friend_requests WHERE status = 'pending' AND id NOT IN ("
+        "SELECT MIN(id) FROM friend_requests WHERE status = 'pending' "
+        "GROUP BY sender_id, receiver_id)"
+    ))
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_friend_requests_pending "
+        "ON friend_requests (sender_id, receiver_id) WHERE status = 'pending'"
+    ))
+
+# 维护 user_stats 版本号的触发器
+# 好友和好友申请列表中包含对方的用户名、邮箱和资料，对方修改时同样需要更新版本号
+_BUMP_FRIENDS_OF = (
+    "UPDATE user_stats SET friends_version = friends_version + 1 "
+    "WHERE user_id IN (SELECT user_id FROM friendships WHERE friend_id = {uid}); "
+)
+_BUMP_REQUESTS_OF = (
+    "UPDATE user_stats SET requests_version = requests_version + 1 "
+    "WHERE user_id IN (SELECT receiver_id FROM friend_requests WHERE sender_id = {uid} AND status = 'pending' "
+    "UNION SELECT sender_id FROM friend_requests WHERE receiver_id = {uid} AND status = 'pending'); "
+)
+_BUMP_PROFILE = (
+    "INSERT INTO user_stats (user_id, profile_version) VALUES ({uid}, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET profile_version = profile_version + 1; "
+)
+_BUMP_FRIENDS = (
+    "INSERT INTO user_stats (user_id, friends_version) VALUES ({uid}, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET friends_version = friends_version + 1; "
+)
+_BUMP_REQUESTS = (
+    "INSERT INTO user_stats (user_id, requests_version) VALUES ({uid}, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET requests_version = requests_version + 1; "
+)
+
+USER_VERSION_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS user_versions_profiles_ai AFTER INSERT ON user_profiles BEGIN "
+    + _BUMP_PROFILE.format(uid="new.user_id")
+    + _BUMP_FRIENDS_OF.format(uid="new.user_id")
+    + _BUMP_REQUESTS_OF.format(uid="new.user_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_profiles_au AFTER UPDATE ON user_profiles BEGIN "
+    + _BUMP_PROFILE.format(uid="new.user_id")
+    + _BUMP_FRIENDS_OF.format(uid="new.user_id")
+    + _BUMP_REQUESTS_OF.format(uid="new.user_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_profiles_ad AFTER DELETE ON user_profiles BEGIN "
+    + _BUMP_PROFILE.format(uid="old.user_id")
+    + _BUMP_FRIENDS_OF.format(uid="old.user_id")
+    + _BUMP_REQUESTS_OF.format(uid="old.user_id")
+    + "END",
+    # 只关心列表中展示的字段，在线状态等频繁变化的字段不触发
+    "CREATE TRIGGER IF NOT EXISTS user_versions_users_au AFTER UPDATE OF username, email ON users BEGIN "
+    + _BUMP_PROFILE.format(uid="new.id")
+    + _BUMP_FRIENDS_OF.format(uid="new.id")
+    + _BUMP_REQUESTS_OF.format(uid="new.id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_friendships_ai AFTER INSERT ON friendships BEGIN "
+    + _BUMP_FRIENDS.format(uid="new.user_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_friendships_ad AFTER DELETE ON friendships BEGIN "
+    + _BUMP_FRIENDS.format(uid="old.user_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_requests_ai AFTER INSERT ON friend_requests BEGIN "
+    + _BUMP_REQUESTS.format(uid="new.sender_id")
+    + _BUMP_REQUESTS.format(uid="new.receiver_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_requests_au AFTER UPDATE ON friend_requests BEGIN "
+    + _BUMP_REQUESTS.format(uid="new.sender_id")
+    + _BUMP_REQUESTS.format(uid="new.receiver_id")
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_versions_requests_ad AFTER DELETE ON friend_requests BEGIN "
+    + _BUMP_REQUESTS.format(uid="old.sender_id")
+    + _BUMP_REQUESTS.format(uid="old.receiver_id")
+    + "END",
+]
+
+async def _user_versions(conn) -> None:
+    """为 user_stats 添加资料、好友列表和好友申请列表的版本号，供 ETag 使用"""
+    await _add_columns(conn, "user_stats", [
+        ("profile_version", "INTEGER NOT NULL DEFAULT 0"),
+        ("friends_version", "INTEGER NOT NULL DEFAULT 0"),
+        ("requests_version", "INTEGER NOT NULL DEFAULT 0"),
+    ])
+    for statement in USER_VERSION_TRIGGERS:
+        await conn.execute(text(statement))
+
+async def _conversation_summaries(conn) -> None:
+    """为会话添加最后一条消息和双方未读数，并由现有消息回填"""
+    await _add_columns(conn, "conversations", [
+        ("last_message_id", "INTEGER"),
+        ("user1_unread_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("user2_unread_count", "INTEGER NOT NULL DEFAULT 0"),
+    ])
+    await conn.execute(text(
+        "UPDATE conversations SET "
+        "last_message_id = (SELECT id FROM messages WHERE conversation_id = conversations.id "
+        "ORDER BY created_at DESC, id DESC LIMIT 1), "
+        "user1_unread_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id "
+        "AND is_read = 0 AND sender_id != conversations.user1_id), "
+        "user2_unread_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id "
+        "AND is_read = 0 AND sender_id != conversations.user2_id)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user1_last_message "
+        "ON conversations (user1_id, last_message_at)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user2_last_message "
+        "ON conversations (user2_id, last_message_at)"
+    ))
+
+async def _read_watermarks(conn) -> None:
+    """为会话添加双方的已读位置，由逐条标记的已读状态回填，并按已读位置重新计算未读数"""
+    await _add_columns(conn, "conversations", [
+        ("user1_last_read_message_id", "INTEGER"),
+        ("user1_last_read_at", "DATETIME"),
+        ("user2_last_read_message_id", "INTEGER"),
+        ("user2_last_read_at", "DATETIME"),
+    ])
+    for user, other in (("user1", "user2"), ("user2", "user1")):
+        await conn.execute(text(
+            f"UPDATE conversations SET "
+            f"{user}_last_read_message_id = (SELECT MAX(id) FROM messages "
+            f"WHERE conversation_id = conversations.id AND sender_id = conversations.{other}_id AND is_read = 1), "
+            f"{user}_last_read_at = (SELECT MAX(read_at) FROM messages "
+            f"WHERE conversation_id = conversations.id AND sender_id = conversations.{other}_id AND is_read = 1)"
+        ))
+        await conn.execute(text(
+            f"UPDATE conversations SET {user}_unread_count = (SELECT COUNT(*) FROM messages "
+            f"WHERE conversation_id = conversations.id AND sender_id = conversations.{other}_id "
+            f"AND id > COALESCE(conversations.{user}_last_read_message_id, 0))"
+        ))
+    await conn.execute(text("DROP INDEX IF EXISTS ix_messages_conversation_read_sender"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_sender ON messages (conversation_id, sender_id)"
+    ))
+
+async def _cleared_markers(conn) -> None:
+    """为会话添加清空位置，清空聊天记录改为记录位置后由后台任务分批删除"""
+    await _add_columns(conn, "conversations", [
+        ("cleared_before_message_id", "INTEGER"),
+    ])
+
+async def _fix_backfilled_timestamps(conn) -> None:
+    """
+    修正版本5用 CURRENT_TIMESTAMP 补齐的创建时间（缺少微秒部分）
+    SQLAlchemy 按 YYYY-MM-DD HH:MM:SS.ffffff 存储和比较，格式不一致时键集分页的边界会重复或遗漏记录
+    """
+    for table in ("friendships", "friend_requests"):
+        await conn.execute(text(
+            f"UPDATE {table} SET created_at = created_at || '.000000' WHERE length(created_at) = 19"
+        ))
+
+async def _message_autoincrement(conn) -> None:
+    """
+    以 AUTOINCREMENT 重建 messages 表
+    没有 AUTOINCREMENT 时 SQLite 会重新分配被删除的最大ID，撤回后发送的新消息可能与旧消息同ID，
+    落在已读位置或清空位置之内而被误判为已读或不可见
+    """
+    result = await conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")
+    )
+    if "AUTOINCREMENT" in (result.scalar() or "").upper():
+        return
+
+    result = await conn.execute(text("PRAGMA table_info(messages)"))
+    columns = ", ".join(row[1] for row in result if row[1] in Message.__table__.c)
+    # 旧表的索引和全文索引触发器随旧表删除，新表的索引由模型创建
+    result = await conn.execute(text(
+        "SELECT type, name FROM sqlite_master WHERE tbl_name = 'messages' "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ))
+    for kind, name in result.all():
+        await conn.execute(text(f"DROP {kind.upper()} {name}"))
+    await conn.execute(text("ALTER TABLE messages RENAME TO messages_old"))
+    await conn.run_sync(Message.__table__.create)
+    await conn.execute(text(f"INSERT INTO messages ({columns}) SELECT {columns} FROM messages_old"))
+    await conn.execute(text("DROP TABLE messages_old"))
+
+    # 新ID从现有消息和会话中记录过的最大消息ID之后开始（被撤回的消息ID也不再分配）
+    await conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+    await conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'messages', MAX("
+        "COALESCE((SELECT MAX(id) FROM messages), 0), "
+        "COALESCE((SELECT MAX(MAX(COALESCE(last_message_id, 0), COALESCE(user1_last_read_message_id, 0), "
+        "COALESCE(user2_last_read_message_id, 0), COALESCE(cleared_before_message_id, 0))) "
+        "FROM conversations), 0))"
+    ))
+    # 消息ID不变，全文索引的内容无需重建，只需重新创建同步触发器
+    await create_message_search_index(conn)
+
+# (版本号, 名称, 迁移函数)
+MIGRATIONS: List[Tuple[int, str, Callable[..., Awaitable[None]]]] = [
+    (1, "initial_schema", _initial_schema),
+    (2, "users_email_normalized", backfill_email_normalized),
+    (3, "user_search_index", create_user_search_index),
+    (4, "composite_indexes", _composite_indexes),
+    (5, "pagination_counters", _pagination_counters),
+    (6, "unique_pending_requests", _unique_pending_requests),
+    (7, "user_versions", _user_versions),
+    (8, "conversation_summaries", _conversation_summaries),
+    (9, "message_search_index", create_message_search_index),
+    (10, "read_watermarks", _read_watermarks),
+    (11, "cleared_markers", _cleared_markers),
+    (12, "fix_backfilled_timestamps", _fix_backfilled_timestamps),
+    (13, "message_autoincrement", _message_autoincrement),
+]
+
+async def get_schema_version(conn) -> int:
+    """
+    获取数据库当前的结构版本
+    :param conn: 异步数据库连接
+    :return: 已执行的最高版本号，未执行过迁移时返回0
+    """
+    if not await _table_exists(conn, "schema_version"):
+        return 0
+    result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+    return result.scalar() or 0
+
+async def run_migrations(conn) -> int:
+    """
+    执行所有尚未执行的迁移
+    所有迁移和版本记录在调用方的同一个事务中提交，任何一个迁移失败都会整体回滚
+    :param conn: 异步数据库连接（由 async_engine.begin() 创建）
+    :return: 本次执行的迁移数
+    """
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    current = await get_schema_version(conn)
+
+    applied = 0
+    for version, name, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"执行数据库迁移 {version}: {name}")
+        await migrate(conn)
+        await conn.execute(
+            text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+            {"version": version, "name": name, "applied_at": datetime.now(timezone.utc)}
+        )
+        applied += 1
+    return applied
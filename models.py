@@ -1,7 +1,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, event, text, case, or_, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, relationship
@@ -24,12 +24,23 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+def normalize_email(email: str | None) -> str | None:
+    """
+    规范化邮箱（去除首尾空白并转为小写），用于唯一性校验和索引查询
+    :param email: 原始邮箱
+    :return: 规范化后的邮箱
+    """
+    if email is None:
+        return None
+    return email.strip().lower()
+
 # 用户模型
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
+    email_normalized = Column(String, unique=True, index=True)  # 规范化邮箱，所有邮箱查询都走这一列
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
     is_online = Column(Boolean, default=False)
@@ -51,6 +62,66 @@ class User(Base):
         back_populates="friends"
     )
 
+@event.listens_for(User.email, "set")
+def _sync_email_normalized(target, value, oldvalue, initiator):
+    """设置邮箱时同步更新规范化邮箱"""
+    target.email_normalized = normalize_email(value)
+
+async def backfill_email_normalized(conn) -> None:
+    """
+    为旧数据库补充 email_normalized 列并回填数据
+    规范化后重复的邮箱只保留最早注册的用户，其余保持为空，这些用户通过 email_lookup 按原始邮箱查找
+    :param conn: 异步数据库连接
+    """
+    columns = await conn.execute(text("PRAGMA table_info(users)"))
+    if "email_normalized" not in {row[1] for row in columns}:
+        await conn.execute(text("ALTER TABLE users ADD COLUMN email_normalized VARCHAR"))
+
+    result = await conn.execute(
+        text("SELECT id, email FROM users WHERE email_normalized IS NULL AND email IS NOT NULL ORDER BY id")
+    )
+    rows = result.all()
+    if rows:
+        existing = await conn.execute(
+            text("SELECT email_normalized FROM users WHERE email_normalized IS NOT NULL")
+        )
+        seen = {row[0] for row in existing}
+        updates = []
+        for user_id, email in rows:
+            normalized = normalize_email(email)
+            if normalized in seen:
+                print(f"用户 {user_id} 的邮箱与已有用户重复，未回填规范化邮箱，只能按原始邮箱查找")
+                continue
+            seen.add(normalized)
+            updates.append({"id": user_id, "email_normalized": normalized})
+        if updates:
+            await conn.execute(
+                text("UPDATE users SET email_normalized = :email_normalized WHERE id = :id"),
+                updates
+            )
+
+    await conn.execute(
+        text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_normalized ON users (email_normalized)")
+    )
+
+def email_lookup(email: str | None):
+    """
+    按邮箱查找用户的过滤条件：匹配规范化邮箱，或与原始邮箱完全一致
+    旧数据中仅大小写或空白不同的邮箱回填后只有一个用户有规范化邮箱，其余用户只能按原始邮箱找到
+    需配合 email_exact_first 排序，两者都命中时取原始邮箱完全一致的用户
+    :param email: 查询的邮箱
+    :return: 过滤条件
+    """
+    return or_(User.email_normalized == normalize_email(email), User.email == email)
+
+def email_exact_first(email: str | None):
+    """
+    按邮箱查找用户时的排序条件，原始邮箱完全一致的用户排在前面
+    :param email: 查询的邮箱
+    :return: 排序条件
+    """
+    return case((User.email == email, 0), else_=1)
+
 # 用户资料
 class UserProfile(Base):
     __tablename__ = "user_profiles"
@@ -71,7 +142,12 @@ class Friendship(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     friend_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ux_friendships_user_friend", "user_id", "friend_id", unique=True),
+        Index("ix_friendships_user_created", "user_id", "created_at", "id"),
+    )
 
 # 好友申请
 class FriendRequest(Base):
@@ -80,12 +156,34 @@ class FriendRequest(Base):
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
     status = Column(String)  # pending, accepted, rejected
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_friend_requests")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_friend_requests")
 
+    __table_args__ = (
+        Index("ix_friend_requests_receiver_status_created", "receiver_id", "status", "created_at", "id"),
+        Index("ix_friend_requests_sender_status_created", "sender_id", "status", "created_at", "id"),
+        # 同一对用户之间只能有一条待处理的申请
+        Index(
+            "ux_friend_requests_pending", "sender_id", "receiver_id",
+            unique=True, sqlite_where=text("status = 'pending'")
+        ),
+    )
+
+# 用户统计计数和数据版本号（由数据库触发器维护，避免 COUNT(*) 扫描）
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    friends_count = Column(Integer, nullable=False, default=0, server_default="0")  # 好友数
+    received_requests_count = Column(Integer, nullable=False, default=0, server_default="0")  # 待处理的收到的申请数
+    sent_requests_count = Column(Integer, nullable=False, default=0, server_default="0")  # 待处理的发出的申请数
+    # 版本号: 对应数据每次变化时加一，用于生成 ETag
+    profile_version = Column(Integer, nullable=False, default=0, server_default="0")  # 本人资料
+    friends_version = Column(Integer, nullable=False, default=0, server_default="0")  # 好友列表（含好友的资料）
+    requests_version = Column(Integer, nullable=False, default=0, server_default="0")  # 好友申请列表（含对方的资料）
+
 # 聊天会话
 class Conversation(Base):
     __tablename__ = "conversations"
@@ -94,12 +192,28 @@ class Conversation(Base):
     user2_id = Column(Integer, ForeignKey("users.id"))  # 始终是消息接收者的ID
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     last_message_at = Column(DateTime, default=datetime.now(timezone.utc))
+    # 会话摘要（在发送、读取、撤回和清空消息时同步维护，会话列表无需逐个查询消息表）
+    last_message_id = Column(Integer, nullable=True)  # 最后一条消息的ID
+    user1_unread_count = Column(Integer, nullable=False, default=0, server_default="0")  # user1 的未读消息数
+    user2_unread_count = Column(Integer, nullable=False, default=0, server_default="0")  # user2 的未读消息数
+    # 已读位置: 参与者已读到的最后一条消息ID及时间，ID不超过该值的对方消息均视为已读
+    user1_last_read_message_id = Column(Integer, nullable=True)
+    user1_last_read_at = Column(DateTime(timezone=True), nullable=True)
+    user2_last_read_message_id = Column(Integer, nullable=True)
+    user2_last_read_at = Column(DateTime(timezone=True), nullable=True)
+    # 清空位置: ID不超过该值的消息已被清空（读取时过滤，由后台任务分批物理删除）
+    cleared_before_message_id = Column(Integer, nullable=True)
 
     # 关系
     user1 = relationship("User", foreign_keys=[user1_id])
     user2 = relationship("User", foreign_keys=[user2_id])
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_conversations_user1_last_message", "user1_id", "last_message_at"),
+        Index("ix_conversations_user2_last_message", "user2_id", "last_message_at"),
+    )
+
 # 消息
 class Message(Base):
     __tablename__ = "messages"
@@ -108,15 +222,24 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey("users.id"))  # 发送者ID
     content = Column(Text)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
-    is_read = Column(Boolean, default=False)  # 消息是否已读
-    read_at = Column(DateTime, nullable=True)  # 读取时间
+    is_read = Column(Boolean, default=False)  # 消息是否已读（旧版本逐条标记，现由会话的已读位置判断）
+    read_at = Column(DateTime, nullable=True)  # 读取时间（同上）
 
     # 关系
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
 
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+        # 索引隐含 rowid，统计已读位置之后的对方消息数只需扫描索引范围
+        Index("ix_messages_conversation_sender", "conversation_id", "sender_id"),
+        # 已读位置和清空位置按消息ID比较，ID不能在撤回或删除后被重新分配
+        {"sqlite_autoincrement": True},
+    )
+
 # 删除其他未使用的表（如果存在）
 __all__ = [
     'User', 'UserProfile', 'Friendship', 'FriendRequest',
-    'Conversation', 'Message'
+    'Conversation', 'Message', 'UserStats', 'normalize_email',
+    'email_lookup', 'email_exact_first'
 ]
@@ -0,0 +1,119 @@
+"""
+分页模块
+提供不透明分页游标的编码和解码，以及按 (created_at, id) 倒序的键集分页条件
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, literal, or_, true, tuple_
+
+# 列表接口的默认和最大每页数量
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(data: Dict) -> str:
+    """
+    将分页位置编码为不透明游标
+    :param data: 分页位置（可JSON序列化的字典）
+    :return: URL安全的游标字符串
+    """
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict:
+    """
+    解码分页游标
+    :param cursor: encode_cursor 生成的游标
+    :return: 分页位置
+    :raises: HTTPException 如果游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        data = None
+    if not isinstance(data, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+    return data
+
+def encode_keyset_cursor(created_at: Optional[datetime], row_id: int) -> str:
+    """
+    编码 (created_at, id) 键集分页游标
+    :param created_at: 本页最后一条记录的创建时间
+    :param row_id: 本页最后一条记录的ID
+    :return: 游标字符串
+    """
+    return encode_cursor({
+        "t": created_at.isoformat() if created_at else None,
+        "id": row_id
+    })
+
+def decode_keyset_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    解码 (created_at, id) 键集分页游标
+    :param cursor: encode_keyset_cursor 生成的游标
+    :return: (创建时间, ID)
+    :raises: HTTPException 如果游标无效
+    """
+    data = decode_cursor(cursor)
+    try:
+        created_at = datetime.fromisoformat(data["t"]) if data.get("t") else None
+        row_id = int(data["id"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+    return created_at, row_id
+
+def keyset_before(created_column, id_column, cursor: Optional[str]):
+    """
+    生成按 (created_at, id) 倒序分页时“位于游标之后”的查询条件
+    :param created_column: 创建时间列
+    :param id_column: 主键列
+    :param cursor: 上一页返回的游标，为空时表示第一页
+    :return: SQLAlchemy 条件表达式，第一页时返回 true()
+    """
+    if not cursor:
+        return true()
+    created_at, row_id = decode_keyset_cursor(cursor)
+    if created_at is None:
+        return and_(created_column.is_(None), id_column < row_id)
+    # 倒序时空的创建时间排在最后
+    return or_(
+        created_column < created_at,
+        and_(created_column == created_at, id_column < row_id),
+        created_column.is_(None)
+    )
+
+def keyset_compare(created_column, id_column, created_at: datetime, row_id: int, newer: bool):
+    """
+    生成 (created_at, id) 行值比较条件，SQLite 可直接在 (..., created_at) 索引（隐含 rowid）上定位范围
+    要求创建时间列不为空
+    :param created_at: 游标位置的创建时间
+    :param row_id: 游标位置的ID
+    :param newer: True 表示取游标之后（更新）的记录，False 表示之前（更早）的记录
+    :return: SQLAlchemy 条件表达式
+    """
+    key = tuple_(created_column, id_column)
+    position = tuple_(literal(created_at, created_column.type), literal(row_id, id_column.type))
+    return key > position if newer else key < position
+
+def check_limit(limit: int, maximum: int = MAX_PAGE_SIZE) -> None:
+    """
+    校验分页大小
+    :param limit: 每页数量
+    :param maximum: 最大允许值
+    :raises: HTTPException 如果超出范围
+    """
+    if not 1 <= limit <= maximum:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit 必须在1到{maximum}之间"
+        )
@@ -7,6 +7,9 @@ from .registration import router as registration_router
 from .verification import router as verification_router
 from .users import router as users_router
 from .chat import router as chat_router
+from .system import router as system_router
+from .presence import router as presence_router
+from .realtime import router as realtime_router
 
 __all__ = [
     'auth_router',
@@ -14,4 +17,7 @@ __all__ = [
     'verification_router',
     'users_router',
     'chat_router',
+    'system_router',
+    'presence_router',
+    'realtime_router',
 ]
@@ -5,34 +5,39 @@
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from models import User, UserProfile
+from models import User, UserProfile, email_lookup, email_exact_first
 from dependencies import get_db, get_current_user
+from services import user_cache, password_hasher, presence_manager, event_bus, PasswordHasherBusy
 
 # 创建路由器
 router = APIRouter(tags=["认证"])
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class Token(BaseModel):
     """登录请求模型"""
     email: str
     password: str
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    验证密码
+    验证密码（在密码哈希执行器中运行，不阻塞事件循环）
     :param plain_password: 明文密码
     :param hashed_password: 数据库中存储的哈希密码
     :return: 密码是否匹配
+    :raises: HTTPException 如果密码哈希队列已满
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
 
 async def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """
@@ -64,7 +69,8 @@ async def login_for_access_token(request: Token, db: AsyncSession = Depends(get_
     result = await db.execute(
         select(User, UserProfile)
         .outerjoin(UserProfile)
-        .where(User.email == request.email)
+        .where(email_lookup(request.email))
+        .order_by(email_exact_first(request.email))
     )
     user_info = result.first()
     
@@ -86,7 +92,7 @@ async def login_for_access_token(request: Token, db: AsyncSession = Depends(get_
         )
     
     # 验证密码
-    if not verify_password(request.password, user.hashed_password):
+    if not await verify_password(request.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="密码错误",
@@ -101,11 +107,13 @@ async def login_for_access_token(request: Token, db: AsyncSession = Depends(get_
             expires_delta=access_token_expires
         )
         
-        # 更新用户在线状态
-        user.is_online = True
-        user.last_active = datetime.now(timezone.utc)
+        # 保存当前令牌，在线状态由在线状态管理器批量写回
         user.current_token = access_token
         await db.commit()
+        presence_manager.heartbeat(user.id)
+        
+        # 令牌已轮换，旧令牌的用户快照失效
+        user_cache.invalidate_user(user.id)
         
         return {
             "message": "true",
@@ -137,10 +145,12 @@ async def logout(
 ):
     """用户登出"""
     try:
-        current_user.is_online = False
-        current_user.last_active = datetime.now(timezone.utc)
         current_user.current_token = None
         await db.commit()
+        presence_manager.mark_offline(current_user.id)
+        user_cache.invalidate_user(current_user.id)
+        # 关闭该用户在所有工作进程中的实时推送连接
+        event_bus.publish([], {"type": "session.revoked", "user_id": current_user.id})
         return {"message": "Successfully logged out"}
     except Exception as e:
         await db.rollback()
@@ -1,16 +1,25 @@
 """
 聊天模块，处理私聊相关功能
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy import and_, or_, desc, func, case, update
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime, timezone, timedelta
 
-from models import User, Conversation, Message, Friendship
+from models import User, Conversation, Message
 from dependencies import get_current_user, get_db
+from services import friendship_cache, event_bus, message_search, message_writer, MessageWriterBusy, message_purge
+from pagination import (
+    encode_cursor,
+    decode_cursor,
+    encode_keyset_cursor,
+    decode_keyset_cursor,
+    keyset_compare,
+    check_limit,
+)
 
 router = APIRouter(tags=["聊天"])
 
@@ -22,8 +31,164 @@ class MessageCreate(BaseModel):
 
 class MessageSearch(BaseModel):
     """消息搜索请求模型"""
-    conversation_id: int
+    conversation_id: Optional[int] = None  # 会话ID，为空时搜索全部会话
     content: str  # 搜索关键词
+    limit: int = 20  # 每页数量
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor
+
+class MarkRead(BaseModel):
+    """标记已读请求模型"""
+    message_id: Optional[int] = None  # 已读到的消息ID，为空时表示会话中的全部消息
+
+def _participant(conversation: Conversation, user_id: int) -> str:
+    """获取参与者在会话中的字段前缀（user1 或 user2）"""
+    return "user1" if conversation.user1_id == user_id else "user2"
+
+def _unread_field(conversation: Conversation, user_id: int) -> str:
+    """获取会话中某个参与者的未读数字段名"""
+    return f"{_participant(conversation, user_id)}_unread_count"
+
+def _after_cleared(conversation: Conversation):
+    """未被清空的消息（ID大于会话的清空位置），后台删除完成之前被清空的消息仍在表中"""
+    return Message.id > (conversation.cleared_before_message_id or 0)
+
+def _read_state(conversation: Conversation, message: Message) -> Dict:
+    """
+    根据接收方的已读位置判断消息是否已读
+    :return: {"is_read", "read_at"}，read_at 为接收方最近一次推进已读位置的时间
+    """
+    receiver_id = conversation.user2_id if message.sender_id == conversation.user1_id else conversation.user1_id
+    prefix = _participant(conversation, receiver_id)
+    last_read_id = getattr(conversation, f"{prefix}_last_read_message_id")
+    if last_read_id is not None and message.id <= last_read_id:
+        read_at = getattr(conversation, f"{prefix}_last_read_at")
+        return {"is_read": True, "read_at": read_at.isoformat() if read_at else None}
+    # 兼容旧版本逐条标记的已读状态
+    return {
+        "is_read": bool(message.is_read),
+        "read_at": message.read_at.isoformat() if message.read_at else None
+    }
+
+async def _mark_read(
+    db: AsyncSession,
+    conversation: Conversation,
+    user_id: int,
+    message_id: int
+) -> Optional[Dict]:
+    """
+    将参与者的已读位置推进到指定消息（一条条件 UPDATE，已读位置不会后退）
+    未读数按已读位置（及清空位置）之后的对方消息数重新计算，走 (conversation_id, sender_id) 索引范围
+    :return: 新的已读状态，已读位置没有变化时返回None
+    """
+    prefix = _participant(conversation, user_id)
+    last_read_column = getattr(Conversation, f"{prefix}_last_read_message_id")
+    other_id = conversation.user2_id if prefix == "user1" else conversation.user1_id
+    now = datetime.now(timezone.utc)
+    unread = (
+        select(func.count())
+        .select_from(Message)
+        .where(
+            and_(
+                Message.conversation_id == conversation.id,
+                Message.sender_id == other_id,
+                Message.id > max(message_id, conversation.cleared_before_message_id or 0)
+            )
+        )
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(Conversation)
+        .where(
+            and_(
+                Conversation.id == conversation.id,
+                or_(last_read_column.is_(None), last_read_column < message_id)
+            )
+        )
+        .values({
+            f"{prefix}_last_read_message_id": message_id,
+            f"{prefix}_last_read_at": now,
+            f"{prefix}_unread_count": unread
+        })
+        .returning(getattr(Conversation, f"{prefix}_unread_count"))
+        .execution_options(synchronize_session=False)
+    )
+    unread_count = result.scalar()
+    if unread_count is None:
+        return None
+    setattr(conversation, f"{prefix}_last_read_message_id", message_id)
+    setattr(conversation, f"{prefix}_last_read_at", now)
+    setattr(conversation, f"{prefix}_unread_count", unread_count)
+    return {"last_read_message_id": message_id, "last_read_at": now, "unread_count": unread_count}
+
+def _publish_read(conversation: Conversation, user_id: int, state: Dict) -> None:
+    """通知会话双方已读位置的变化"""
+    event_bus.publish([conversation.user1_id, conversation.user2_id], {
+        "type": "message.read",
+        "conversation_id": conversation.id,
+        "reader_id": user_id,
+        "last_read_message_id": state["last_read_message_id"],
+        "read_at": state["last_read_at"].isoformat()
+    })
+
+def _add_unread(conversation: Conversation, user_id: int, delta: int) -> None:
+    """
+    调整参与者的未读消息数（以SQL表达式更新，不依赖内存中可能过期的值）
+    :param conversation: 会话
+    :param user_id: 参与者ID
+    :param delta: 变化量
+    """
+    field = _unread_field(conversation, user_id)
+    column = getattr(Conversation, field)
+    setattr(conversation, field, func.max(column + delta, 0))
+
+async def _load_message_page(
+    db: AsyncSession,
+    conversation: Conversation,
+    position: Optional[tuple],
+    newer: bool,
+    limit: int,
+    inclusive: bool = False
+) -> tuple:
+    """
+    从指定位置向更早或更新的方向取一页消息（按 (created_at, id) 键集分页），不包含已清空的消息
+    :param position: (创建时间, ID)，为空时从最新的消息开始
+    :param newer: 是否向更新的方向
+    :param inclusive: 结果是否包含 position 本身
+    :return: ((消息, 发送者) 列表（从新到旧）, 该方向上是否还有更多消息)
+    """
+    query = (
+        select(Message, User)
+        .join(User, Message.sender_id == User.id)
+        .where(and_(Message.conversation_id == conversation.id, _after_cleared(conversation)))
+    )
+    if position is not None:
+        created_at, row_id = position
+        condition = keyset_compare(Message.created_at, Message.id, created_at, row_id, newer)
+        if inclusive:
+            condition = or_(condition, Message.id == row_id)
+        query = query.where(condition)
+    if newer:
+        query = query.order_by(Message.created_at, Message.id)
+    else:
+        query = query.order_by(desc(Message.created_at), desc(Message.id))
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        rows.reverse()
+    return rows, has_more
+
+async def _refresh_last_message(db: AsyncSession, conversation: Conversation) -> None:
+    """重新查找会话的最后一条消息（撤回最后一条消息后调用）"""
+    result = await db.execute(
+        select(Message.id)
+        .where(and_(Message.conversation_id == conversation.id, _after_cleared(conversation)))
+        .order_by(desc(Message.created_at), desc(Message.id))
+        .limit(1)
+    )
+    conversation.last_message_id = result.scalar()
 
 # API路由
 @router.get("/conversations")
@@ -32,9 +197,13 @@ async def get_conversations(
     current_user: User = Depends(get_current_user)
 ):
     """获取当前用户的所有会话列表"""
-    # 查询所有相关会话
+    # 会话、对方用户和最后一条消息在一次查询中取出，未读数由会话记录维护
+    is_user1 = Conversation.user1_id == current_user.id
+    other_user_id = case((is_user1, Conversation.user2_id), else_=Conversation.user1_id)
     result = await db.execute(
-        select(Conversation)
+        select(Conversation, User, Message)
+        .join(User, User.id == other_user_id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
         .where(
             or_(
                 Conversation.user1_id == current_user.id,
@@ -43,41 +212,9 @@ async def get_conversations(
         )
         .order_by(desc(Conversation.last_message_at))
     )
-    conversations = result.scalars().all()
-
-    # 处理会话列表
-    conv_list = []
-    for conv in conversations:
-        # 获取对话的另一方用户信息
-        other_user_id = conv.user2_id if conv.user1_id == current_user.id else conv.user1_id
-        user_result = await db.execute(
-            select(User).where(User.id == other_user_id)
-        )
-        other_user = user_result.scalar()
-
-        # 获取最后一条消息
-        last_msg_result = await db.execute(
-            select(Message)
-            .where(Message.conversation_id == conv.id)
-            .order_by(desc(Message.created_at))
-            .limit(1)
-        )
-        last_msg = last_msg_result.scalar()
-
-        # 获取未读消息数
-        unread_result = await db.execute(
-            select(func.count(Message.id))
-            .where(
-                and_(
-                    Message.conversation_id == conv.id,
-                    Message.sender_id != current_user.id,
-                    Message.is_read == False
-                )
-            )
-        )
-        unread_count = unread_result.scalar()
 
-        conv_list.append({
+    return [
+        {
             "conversation_id": conv.id,
             "other_user": {
                 "id": other_user.id,
@@ -85,17 +222,40 @@ async def get_conversations(
                 "email": other_user.email
             },
             "last_message": {
-                "content": last_msg.content if last_msg else None,
-                "sender_id": last_msg.sender_id if last_msg else None,
-                "created_at": last_msg.created_at.isoformat() if last_msg else None,
-                "is_read": last_msg.is_read if last_msg else None
+                "content": last_msg.content,
+                "sender_id": last_msg.sender_id,
+                "created_at": last_msg.created_at.isoformat(),
+                "is_read": _read_state(conv, last_msg)["is_read"]
             } if last_msg else None,
-            "unread_count": unread_count,
+            "unread_count": getattr(conv, _unread_field(conv, current_user.id)),
             "created_at": conv.created_at.isoformat(),
             "last_message_at": conv.last_message_at.isoformat()
-        })
+        }
+        for conv, other_user, last_msg in result.all()
+    ]
 
-    return conv_list
+def _publish_new_message(
+    conversation_id: int,
+    message_id: int,
+    sender: User,
+    receiver_id: int,
+    content: str,
+    created_at: datetime
+) -> None:
+    """推送新消息给接收者和发送者的其他设备"""
+    event_bus.publish([receiver_id, sender.id], {
+        "type": "message.new",
+        "conversation_id": conversation_id,
+        "message": {
+            "id": message_id,
+            "sender": {
+                "id": sender.id,
+                "username": sender.username
+            },
+            "content": content,
+            "created_at": created_at.isoformat()
+        }
+    })
 
 @router.post("/messages")
 async def send_message(
@@ -122,26 +282,40 @@ async def send_message(
         )
 
     # 验证是否为好友
-    result = await db.execute(
-        select(Friendship).where(
-            or_(
-                and_(
-                    Friendship.user_id == current_user.id,
-                    Friendship.friend_id == receiver.id
-                ),
-                and_(
-                    Friendship.user_id == receiver.id,
-                    Friendship.friend_id == current_user.id
-                )
-            )
-        )
-    )
-    if not result.scalar():
+    if not await friendship_cache.are_friends(db, current_user.id, receiver.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="只能给好友发送消息"
         )
 
+    if message_writer.enabled:
+        # 批量模式: 交给写入任务与其他请求的消息合并提交
+        # 等待期间不占用连接池中的连接，否则并发请求会耗尽连接池，写入任务拿不到连接
+        await db.close()
+        try:
+            written = await message_writer.submit(current_user.id, receiver.id, message.content)
+        except MessageWriterBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": "1"},
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"发送消息失败: {str(e)}"
+            )
+        _publish_new_message(
+            written["conversation_id"], written["message_id"], current_user, receiver.id,
+            message.content, written["created_at"]
+        )
+        return {
+            "message": "发送成功",
+            "conversation_id": written["conversation_id"],
+            "message_id": written["message_id"],
+            "created_at": written["created_at"].isoformat()
+        }
+
     # 查找或创建会话
     now = datetime.now(timezone.utc)
     result = await db.execute(
@@ -178,13 +352,20 @@ async def send_message(
         created_at=now
     )
     db.add(new_message)
+    await db.flush()
 
-    # 更新会话的最后消息时间
+    # 更新会话摘要: 最后消息时间、最后一条消息和接收者的未读数
     conversation.last_message_at = now
+    conversation.last_message_id = new_message.id
+    _add_unread(conversation, receiver.id, 1)
 
     try:
         await db.commit()
         await db.refresh(new_message)
+        _publish_new_message(
+            conversation.id, new_message.id, current_user, receiver.id,
+            new_message.content, new_message.created_at
+        )
         return {
             "message": "发送成功",
             "conversation_id": conversation.id,
@@ -201,12 +382,28 @@ async def send_message(
 @router.get("/conversations/{conversation_id}/messages")
 async def get_messages(
     conversation_id: int,
+    response: Response,
     limit: int = 20,
+    cursor: Optional[str] = None,
+    direction: str = "older",
+    around: Optional[int] = None,
     before_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取会话消息记录"""
+    """
+    获取会话消息记录（从新到旧排列）
+    按 (created_at, id) 键集分页: 更早一页的游标在 X-Older-Cursor 响应头中，更新一页的在 X-Newer-Cursor 中
+    direction=older/newer 指定 cursor 的翻页方向；around=消息ID 返回该消息前后的消息（用于从搜索结果跳转）
+    before_id 为旧版本的分页参数，仍然兼容
+    """
+    check_limit(limit)
+    if direction not in ("older", "newer"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="direction 必须是 older 或 newer"
+        )
+
     # 验证用户是否是会话参与者
     result = await db.execute(
         select(Conversation).where(
@@ -226,29 +423,80 @@ async def get_messages(
             detail="无权访问此会话"
         )
 
-    # 构建消息查询
-    query = (
-        select(Message, User)
-        .join(User, Message.sender_id == User.id)
-        .where(Message.conversation_id == conversation_id)
-    )
-    
-    if before_id:
-        query = query.where(Message.id < before_id)
-    
-    query = query.order_by(desc(Message.created_at)).limit(limit)
-    
-    result = await db.execute(query)
-    messages = result.all()
-
-    # 标记消息为已读
-    now = datetime.now(timezone.utc)
-    for msg, _ in messages:
-        if msg.sender_id != current_user.id and not msg.is_read:
-            msg.is_read = True
-            msg.read_at = now
+    anchor_id = around or before_id
+    position = None
+    if anchor_id:
+        result = await db.execute(
+            select(Message.created_at, Message.id).where(
+                and_(
+                    Message.id == anchor_id,
+                    Message.conversation_id == conversation_id,
+                    _after_cleared(conversation)
+                )
+            )
+        )
+        position = result.first()
+        if position is None and not around:
+            # 旧客户端传入的消息可能已被撤回，从ID更小的最近一条消息开始
+            result = await db.execute(
+                select(Message.created_at, Message.id)
+                .where(
+                    and_(
+                        Message.conversation_id == conversation_id,
+                        Message.id < before_id,
+                        _after_cleared(conversation)
+                    )
+                )
+                .order_by(desc(Message.id))
+                .limit(1)
+            )
+            position = result.first()
+            if position is None:
+                return []
+            position = (position.created_at, position.id + 1)
+        if position is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="消息不存在"
+            )
+    elif cursor:
+        position = decode_keyset_cursor(cursor)
+        if position[0] is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的分页游标"
+            )
+
+    has_newer = has_older = False
+    if around:
+        # 目标消息及更早的消息占一半，更新的消息占另一半
+        older, has_older = await _load_message_page(
+            db, conversation, position, False, limit - limit // 2, inclusive=True
+        )
+        newer, has_newer = await _load_message_page(db, conversation, position, True, limit // 2)
+        messages = newer + older
+    elif direction == "newer" and position is not None:
+        messages, has_newer = await _load_message_page(db, conversation, position, True, limit)
+        has_older = True
+    else:
+        messages, has_older = await _load_message_page(db, conversation, position, False, limit)
+        has_newer = position is not None
 
-    await db.commit()
+    if messages:
+        newest, oldest = messages[0][0], messages[-1][0]
+        if has_older:
+            response.headers["X-Older-Cursor"] = encode_keyset_cursor(oldest.created_at, oldest.id)
+        if has_newer:
+            response.headers["X-Newer-Cursor"] = encode_keyset_cursor(newest.created_at, newest.id)
+
+    # 将已读位置推进到本页最新的对方消息，没有变化时不写数据库
+    received = [msg.id for msg, _ in messages if msg.sender_id != current_user.id]
+    if received:
+        state = await _mark_read(db, conversation, current_user.id, max(received))
+        if state:
+            await db.commit()
+            # 通知对方消息已读
+            _publish_read(conversation, current_user.id, state)
 
     return [
         {
@@ -259,12 +507,73 @@ async def get_messages(
             },
             "content": msg.content,
             "created_at": msg.created_at.isoformat(),
-            "is_read": msg.is_read,
-            "read_at": msg.read_at.isoformat() if msg.read_at else None
+            **_read_state(conversation, msg)
         }
         for msg, user in messages
     ]
 
+@router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(
+    conversation_id: int,
+    mark: Optional[MarkRead] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """将会话标记为已读（到指定消息为止，默认全部），已读位置只会前进"""
+    result = await db.execute(
+        select(Conversation).where(
+            and_(
+                Conversation.id == conversation_id,
+                or_(
+                    Conversation.user1_id == current_user.id,
+                    Conversation.user2_id == current_user.id
+                )
+            )
+        )
+    )
+    conversation = result.scalar()
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权访问此会话"
+        )
+
+    message_id = conversation.last_message_id
+    if mark is not None and mark.message_id is not None:
+        # 已读位置只会前进，只接受会话中现有（未被清空）的消息，不能把位置推到尚未发送的消息ID上
+        result = await db.execute(
+            select(Message.id).where(
+                and_(
+                    Message.id == mark.message_id,
+                    Message.conversation_id == conversation_id,
+                    _after_cleared(conversation)
+                )
+            )
+        )
+        message_id = result.scalar()
+        if message_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="消息不存在"
+            )
+
+    state = None
+    if message_id is not None:
+        state = await _mark_read(db, conversation, current_user.id, message_id)
+    if state:
+        await db.commit()
+        _publish_read(conversation, current_user.id, state)
+
+    prefix = _participant(conversation, current_user.id)
+    last_read_at = getattr(conversation, f"{prefix}_last_read_at")
+    return {
+        "message": "已标记为已读" if state else "已读位置未变化",
+        "conversation_id": conversation_id,
+        "last_read_message_id": getattr(conversation, f"{prefix}_last_read_message_id"),
+        "last_read_at": last_read_at.isoformat() if last_read_at else None,
+        "unread_count": getattr(conversation, f"{prefix}_unread_count")
+    }
+
 @router.delete("/messages/{message_id}")
 async def recall_message(
     message_id: int,
@@ -308,9 +617,33 @@ async def recall_message(
                 detail="只能撤回2分钟内的消息"
             )
         
-        # 删除消息
+        # 删除消息，并同步会话摘要
+        result = await db.execute(
+            select(Conversation).where(Conversation.id == message.conversation_id)
+        )
+        conversation = result.scalar()
+        if conversation and message.id <= (conversation.cleared_before_message_id or 0):
+            # 已被清空、等待后台删除的消息
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="消息不存在"
+            )
         await db.delete(message)
+        await db.flush()
+        if conversation:
+            if not _read_state(conversation, message)["is_read"]:
+                receiver_id = conversation.user2_id if conversation.user1_id == message.sender_id else conversation.user1_id
+                _add_unread(conversation, receiver_id, -1)
+            if conversation.last_message_id == message_id:
+                await _refresh_last_message(db, conversation)
         await db.commit()
+
+        if conversation:
+            event_bus.publish([conversation.user1_id, conversation.user2_id], {
+                "type": "message.recalled",
+                "conversation_id": conversation.id,
+                "message_id": message_id
+            })
         
         return {
             "message": "消息已撤回",
@@ -332,57 +665,95 @@ async def search_messages(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """搜索聊天记录"""
+    """
+    搜索聊天记录（指定会话或当前用户参与的全部会话）
+    结果按相关度排序，snippet 中用 <mark></mark> 标出命中的关键词；返回的 next_cursor 用于获取下一页
+    """
+    query = search.content.strip()
+    if not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="搜索关键词不能为空"
+        )
+    if not 1 <= search.limit <= 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit 必须在1到50之间"
+        )
+
+    offset = 0
+    if search.cursor:
+        position = decode_cursor(search.cursor)
+        if (
+            position.get("q") != query
+            or position.get("c") != search.conversation_id
+            or not isinstance(position.get("offset"), int)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="分页游标与搜索条件不匹配"
+            )
+        offset = position["offset"]
+
     try:
         # 验证会话权限
-        result = await db.execute(
-            select(Conversation).where(
-                and_(
-                    Conversation.id == search.conversation_id,
-                    or_(
-                        Conversation.user1_id == current_user.id,
-                        Conversation.user2_id == current_user.id
+        if search.conversation_id is not None:
+            result = await db.execute(
+                select(Conversation.id).where(
+                    and_(
+                        Conversation.id == search.conversation_id,
+                        or_(
+                            Conversation.user1_id == current_user.id,
+                            Conversation.user2_id == current_user.id
+                        )
                     )
                 )
             )
-        )
-        conversation = result.scalar()
-        
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="无权访问此会话"
-            )
+            if result.scalar() is None:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="无权访问此会话"
+                )
         
-        # 搜索消息
-        result = await db.execute(
-            select(Message, User)
-            .join(User, Message.sender_id == User.id)
-            .where(
-                and_(
-                    Message.conversation_id == search.conversation_id,
-                    Message.content.ilike(f"%{search.content}%")
+        # 多取一条用于判断是否还有下一页
+        messages = await message_search.search(
+            db, current_user.id, query, search.conversation_id, search.limit + 1, offset
+        )
+        has_more = len(messages) > search.limit
+        messages = messages[:search.limit]
+
+        # 已读状态由所在会话的已读位置决定
+        conversations = {}
+        if messages:
+            result = await db.execute(
+                select(Conversation).where(
+                    Conversation.id.in_({message.conversation_id for message, _, _ in messages})
                 )
             )
-            .order_by(desc(Message.created_at))
-        )
-        messages = result.all()
+            conversations = {conv.id: conv for conv in result.scalars()}
         
         return {
             "message": "搜索成功",
             "results": [
                 {
                     "id": message.id,
+                    "conversation_id": message.conversation_id,
                     "content": message.content,
+                    "snippet": snippet,
                     "created_at": message.created_at.isoformat(),
-                    "is_read": message.is_read,
+                    "is_read": _read_state(conversations[message.conversation_id], message)["is_read"],
                     "sender": {
                         "id": user.id,
                         "username": user.username
                     }
                 }
-                for message, user in messages
-            ]
+                for message, user, snippet in messages
+            ],
+            "next_cursor": encode_cursor({
+                "q": query,
+                "c": search.conversation_id,
+                "offset": offset + search.limit
+            }) if has_more else None
         }
         
     except HTTPException:
@@ -399,7 +770,10 @@ async def delete_conversation_messages(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """删除指定会话的所有聊天记录"""
+    """
+    删除指定会话的所有聊天记录
+    只记录清空位置（立即对双方生效），消息由后台任务分批删除，不会长时间占用写锁
+    """
     try:
         # 验证用户是否是会话参与者
         result = await db.execute(
@@ -421,22 +795,45 @@ async def delete_conversation_messages(
                 detail="无权访问此会话"
             )
         
-        # 删除所有消息
-        await db.execute(
-            Message.__table__.delete().where(
-                Message.conversation_id == conversation_id
+        # 清空位置推进到当前最新的消息（一条 UPDATE，与发送消息的事务互斥），并清空会话摘要
+        now = datetime.now(timezone.utc)
+        latest = (
+            select(func.max(Message.id))
+            .where(Message.conversation_id == conversation_id)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                cleared_before_message_id=func.max(
+                    func.coalesce(latest, 0),
+                    func.coalesce(Conversation.cleared_before_message_id, 0)
+                ),
+                last_message_at=now,
+                last_message_id=None,
+                user1_unread_count=0,
+                user2_unread_count=0
             )
+            .returning(Conversation.cleared_before_message_id)
+            .execution_options(synchronize_session=False)
         )
-        
-        # 更新会话的最后消息时间
-        conversation.last_message_at = datetime.now(timezone.utc)
+        cleared_before_message_id = result.scalar()
         
         await db.commit()
+        if cleared_before_message_id:
+            message_purge.schedule(conversation_id, cleared_before_message_id)
+        event_bus.publish([conversation.user1_id, conversation.user2_id], {
+            "type": "conversation.cleared",
+            "conversation_id": conversation_id,
+            "cleared_by": current_user.id
+        })
         
         return {
             "message": "聊天记录已清空",
             "conversation_id": conversation_id,
-            "cleared_at": datetime.now(timezone.utc).isoformat()
+            "cleared_before_message_id": cleared_before_message_id,
+            "cleared_at": now.isoformat()
         }
         
     except HTTPException:
@@ -0,0 +1,48 @@
+"""
+在线状态模块
+处理客户端心跳和好友在线状态相关的路由
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import User
+from dependencies import get_current_user, get_db
+from services import presence_manager, friendship_cache
+
+# 创建路由器
+router = APIRouter(tags=["在线状态"])
+
+@router.post("/presence/heartbeat")
+async def heartbeat(current_user: User = Depends(get_current_user)):
+    """
+    客户端心跳接口
+    客户端应在心跳有效期内定期调用，超时未调用将被视为离线
+    """
+    now = presence_manager.heartbeat(current_user.id)
+    return {
+        "message": "ok",
+        "last_active": now.isoformat(),
+        "expires_in": int(presence_manager.ttl.total_seconds())
+    }
+
+@router.get("/presence/friends")
+async def get_friends_presence(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取当前用户所有好友的在线状态
+    好友列表的 ETag 不包含在线状态，客户端收到 304 后通过本接口刷新在线状态
+    """
+    friend_ids = await friendship_cache.get_friend_ids(db, current_user.id)
+    if not friend_ids:
+        return []
+
+    result = await db.execute(select(User).where(User.id.in_(list(friend_ids))))
+    friends = result.scalars().all()
+    statuses = presence_manager.resolve_many(friends)
+    return [
+        {"id": friend.id, "online_status": statuses[friend.id]}
+        for friend in sorted(friends, key=lambda friend: friend.id)
+    ]
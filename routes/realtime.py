@@ -0,0 +1,63 @@
+"""
+实时推送模块
+提供 WebSocket 接口，向在线客户端推送新消息、撤回和已读等事件
+"""
+import json
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from jose import jwt
+
+from models import AsyncSessionLocal
+from dependencies import authenticate_token
+from services import connection_hub, presence_manager
+
+# 创建路由器
+router = APIRouter(tags=["实时推送"])
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = None):
+    """
+    实时事件推送接口
+    浏览器无法为 WebSocket 设置请求头，令牌通过查询参数 ?token= 传递，也支持 Authorization 请求头
+    客户端发送的任意消息都视为一次心跳，发送 {"type": "ping"} 会收到 {"type": "pong"}
+    令牌过期或用户登出后服务端以 1008 关闭连接，已登出的令牌无法重新连接
+    """
+    if not token:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+
+    # 认证完成后立即释放数据库会话，不在连接存续期间占用
+    user = None
+    if token:
+        async with AsyncSessionLocal() as db:
+            user = await authenticate_token(token, db)
+            # 已登出或已重新登录的旧令牌不能再建立连接
+            if user is not None and user.current_token != token:
+                user = None
+            user_id = user.id if user else None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="无法验证凭据")
+        return
+
+    # 令牌已通过校验，这里只读取其中的过期时间
+    expires_at = jwt.get_unverified_claims(token).get("exp")
+
+    await websocket.accept()
+    connection = connection_hub.connect(websocket, user_id, expires_at)
+    connection_hub.send(connection, {"type": "ready", "user_id": user_id})
+    try:
+        while True:
+            data = await websocket.receive_text()
+            presence_manager.heartbeat(user_id)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("type") == "ping":
+                connection_hub.send(connection, {"type": "pong"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await connection_hub.disconnect(connection)
@@ -6,18 +6,15 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from pydantic import BaseModel
-from passlib.context import CryptContext
 
-from models import User
+from models import User, normalize_email
 from dependencies import get_db
+from services import password_hasher, PasswordHasherBusy
 from .verification import verify_code, clear_verification_code
 
 # 创建路由器
 router = APIRouter(tags=["注册"])
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class RegisterRequest(BaseModel):
     """注册请求模型"""
     username: str
@@ -46,7 +43,7 @@ async def register_user(request: RegisterRequest, db: AsyncSession = Depends(get
     
     # 检查邮箱是否已存在
     result = await db.execute(
-        select(User).where(User.email.ilike(request.email))
+        select(User).where(User.email_normalized == normalize_email(request.email))
     )
     email_check = result.scalars().first()
     if email_check:
@@ -56,16 +53,23 @@ async def register_user(request: RegisterRequest, db: AsyncSession = Depends(get
         )
     
     # 验证邮箱验证码
-    if not verify_code(request.email, request.verification_code):
+    if not await verify_code(request.email, request.verification_code):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="验证码无效或已过期",
         )
     
+    # 对密码进行哈希处理（在密码哈希执行器中运行）
+    try:
+        hashed_password = await password_hasher.hash(request.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    
     try:
-        # 对密码进行哈希处理
-        hashed_password = pwd_context.hash(request.password)
-        
         # 创建新用户记录
         new_user = User(
             username=request.username,
@@ -79,7 +83,7 @@ async def register_user(request: RegisterRequest, db: AsyncSession = Depends(get
         await db.refresh(new_user)
         
         # 清理验证码
-        clear_verification_code(request.email)
+        await clear_verification_code(request.email)
         
         return {
             "message": "注册成功",
@@ -0,0 +1,50 @@
+"""
+系统模块
+提供运行状态和缓存统计等运维接口
+"""
+from fastapi import APIRouter, HTTPException, status
+from pydantic import BaseModel
+
+from services import (
+    user_cache,
+    password_hasher,
+    presence_manager,
+    verification_store,
+    mail_queue,
+    friendship_cache,
+    friend_graph,
+    connection_hub,
+    event_bus,
+    message_writer,
+    message_purge,
+)
+
+# 创建路由器
+router = APIRouter(tags=["系统"])
+
+class SystemAccess(BaseModel):
+    """系统接口访问请求模型"""
+    root: str
+
+@router.post("/system/stats")
+async def get_system_stats(request: SystemAccess):
+    """获取缓存命中率等运行统计"""
+    if request.root != "azyasaxi":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无访问权限"
+        )
+
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "presence": presence_manager.stats(),
+        "verification_store": await verification_store.stats(),
+        "mail_queue": mail_queue.stats(),
+        "friendship_cache": friendship_cache.stats(),
+        "friend_graph": friend_graph.stats(),
+        "realtime": connection_hub.stats(),
+        "event_bus": event_bus.stats(),
+        "message_writer": message_writer.stats(),
+        "message_purge": message_purge.stats()
+    }
@@ -2,16 +2,32 @@
 用户模块
 处理用户相关的路由，包括用户资料和好友关系
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, or_
+from sqlalchemy import DateTime, and_, or_, exists, insert, literal, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+import json
+import tempfile
 
-from models import User, UserProfile, FriendRequest, Friendship
-from dependencies import get_current_user, get_db
+from config import USER_LIST_BATCH_SIZE
+from models import User, UserProfile, FriendRequest, Friendship, UserStats, AsyncSessionLocal, email_lookup, email_exact_first
+from dependencies import get_current_user, get_optional_user, get_db
+from etags import make_etag, check_etag
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    encode_cursor,
+    decode_cursor,
+    encode_keyset_cursor,
+    keyset_before,
+    check_limit,
+)
+from services import user_cache, presence_manager, user_search, friendship_cache, friend_graph, event_bus
+from services.user_import import UserImporter, iter_lines, parse_rows, read_blocks
 
 # 创建路由器
 router = APIRouter(tags=["用户"])
@@ -33,77 +49,257 @@ class FriendRequestAction(BaseModel):
     """好友申请处理请求模型"""
     action: str  # accept or reject
 
+class FriendRequestBatchAction(BaseModel):
+    """批量处理好友申请请求模型"""
+    request_ids: List[int]
+    action: str  # accept or reject
+
+# 单次批量处理的最大申请数
+MAX_BATCH_REQUESTS = 500
+
+class UserBatchLookup(BaseModel):
+    """批量查询用户请求模型"""
+    ids: List[int] = []  # 用户ID列表
+    usernames: List[str] = []  # 用户名列表
+
+# 单次批量查询的最大用户数
+MAX_BATCH_USERS = 200
+
 class UserListAccess(BaseModel):
     """用户列表访问请求模型"""
     root: str
+    after_id: Optional[int] = None  # 只返回ID大于该值的用户（键集分页）
+    limit: Optional[int] = None  # 最多返回的用户数，为空时返回全部
+    format: str = "json"  # json（JSON数组）或 ndjson（每行一个用户）
+
+def _serialize_user(user: User, profile: Optional[UserProfile], friends: List[dict]) -> dict:
+    """组装 /users/all 中单个用户的数据"""
+    online_status = presence_manager.resolve(user)
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "profile": {
+            "avatar_url": profile.avatar_url,
+            "background_url": profile.background_url,
+            "gender": profile.gender,
+            "bio": profile.bio
+        } if profile else None,
+        "online_status": {
+            **online_status,
+            "access_token": user.current_token if online_status["is_online"] else None
+        },
+        "friends": friends
+    }
+
+async def _iter_all_users(after_id: Optional[int], limit: Optional[int]):
+    """
+    按用户ID键集分页遍历用户，每页只执行两次查询（用户+资料、该页全部好友）
+    内存占用只与每页大小有关，与用户总数无关
+    :param after_id: 起始用户ID（不包含）
+    :param limit: 最多返回的用户数
+    :return: 用户数据迭代器
+    """
+    last_id = after_id or 0
+    remaining = limit
+    # 流式响应在依赖项清理之后才执行，需要自己管理会话
+    async with AsyncSessionLocal() as db:
+        while remaining is None or remaining > 0:
+            page_size = USER_LIST_BATCH_SIZE if remaining is None else min(USER_LIST_BATCH_SIZE, remaining)
+            result = await db.execute(
+                select(User, UserProfile)
+                .outerjoin(UserProfile)
+                .where(User.id > last_id)
+                .order_by(User.id)
+                .limit(page_size)
+            )
+            page = result.all()
+            if not page:
+                break
+            
+            # 一次查询取出本页所有用户的好友
+            user_ids = [user.id for user, _ in page]
+            friend_result = await db.execute(
+                select(Friendship.user_id, User.id, User.username)
+                .join(User, User.id == Friendship.friend_id)
+                .where(Friendship.user_id.in_(user_ids))
+                .order_by(Friendship.user_id, Friendship.id)
+            )
+            user_friends = {}
+            for user_id, friend_id, friend_username in friend_result:
+                user_friends.setdefault(user_id, []).append(
+                    {"id": friend_id, "username": friend_username}
+                )
+            
+            for user, profile in page:
+                yield _serialize_user(user, profile, user_friends.get(user.id, []))
+            
+            last_id = user_ids[-1]
+            if remaining is not None:
+                remaining -= len(page)
+            # 释放本页对象，避免会话中累积
+            db.expunge_all()
+            if len(page) < page_size:
+                break
 
 # API路由
 @router.post("/users/all")
-async def get_all_users(
-    request: UserListAccess,
-    db: AsyncSession = Depends(get_db)
-):
-    """获取所有用户列表（包含其好友信息、在线状态和用户资料）"""
+async def get_all_users(request: UserListAccess):
+    """
+    获取所有用户列表（包含其好友信息、在线状态和用户资料）
+    按用户ID升序流式返回，可通过 after_id 和 limit 分页（下一页的 after_id 为本页最后一个用户的ID）
+    """
     if request.root != "azyasaxi":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无访问权限"
         )
+    if request.format not in ("json", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="仅支持 json 或 ndjson 格式"
+        )
+    if request.limit is not None and request.limit <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit 必须大于0"
+        )
     
-    result = await db.execute(
-        select(User, UserProfile)
-        .outerjoin(UserProfile)
-    )
-    users = result.all()
+    users = _iter_all_users(request.after_id, request.limit)
     
-    # 获取每个用户的好友列表
-    user_friends = {}
-    for user, _ in users:
-        friend_result = await db.execute(
-            select(User)
-            .join(Friendship, User.id == Friendship.friend_id)
-            .where(Friendship.user_id == user.id)
+    if request.format == "ndjson":
+        async def ndjson_body():
+            async for item in users:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+    
+    async def json_body():
+        separator = "["
+        async for item in users:
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+    return StreamingResponse(json_body(), media_type="application/json")
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    root: str,
+    format: Optional[str] = None
+):
+    """
+    批量导入用户
+    请求体为原始文件内容: CSV（表头: username,email,password）或每行一个JSON对象的JSONL
+    请求体先写入临时文件（超过1MB才落盘），随后逐块导入，以NDJSON流式返回每一块的进度和逐行错误
+    """
+    if root != "azyasaxi":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无访问权限"
         )
-        friends = friend_result.scalars().all()
-        user_friends[user.id] = [
-            {"id": friend.id, "username": friend.username}
-            for friend in friends
-        ]
     
-    return [
-        {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "profile": {
-                "avatar_url": profile.avatar_url if profile else None,
-                "background_url": profile.background_url if profile else None,
-                "gender": profile.gender if profile else None,
-                "bio": profile.bio if profile else None
-            } if profile else None,
-            "online_status": {
-                "is_online": user.is_online,
-                "last_active": user.last_active.isoformat() if user.last_active else None,
-                "access_token": user.current_token if user.is_online else None
-            },
-            "friends": user_friends.get(user.id, [])
-        }
-        for user, profile in users
-    ]
+    fmt = format or ("jsonl" if "json" in request.headers.get("content-type", "") else "csv")
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="仅支持 csv 或 jsonl 格式"
+        )
+    
+    # 流式响应开始后无法再读取请求体，因此先把请求体转存到临时文件
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+    
+    async def progress():
+        rows = parse_rows(iter_lines(read_blocks(upload)), fmt)
+        try:
+            async for event in UserImporter().run(rows):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"导入失败: {str(e)}"}, ensure_ascii=False) + "\n"
+        finally:
+            upload.close()
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+async def _get_user_stats(db: AsyncSession, user_id: int) -> UserStats:
+    """获取由触发器维护的用户计数，没有记录时视为全部为0"""
+    stats = await db.get(UserStats, user_id)
+    return stats or UserStats(
+        user_id=user_id,
+        friends_count=0,
+        received_requests_count=0,
+        sent_requests_count=0,
+        profile_version=0,
+        friends_version=0,
+        requests_version=0
+    )
+
+async def _get_friend_page(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str]
+):
+    """
+    按建立好友关系的时间倒序获取一页好友
+    :return: ((好友关系, 用户, 用户资料) 列表, 下一页游标)
+    """
+    result = await db.execute(
+        select(Friendship, User, UserProfile)
+        .join(User, User.id == Friendship.friend_id)
+        .outerjoin(UserProfile, User.id == UserProfile.user_id)
+        .where(
+            and_(
+                Friendship.user_id == user_id,
+                keyset_before(Friendship.created_at, Friendship.id, cursor)
+            )
+        )
+        .order_by(Friendship.created_at.desc(), Friendship.id.desc())
+        .limit(limit + 1)
+    )
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_keyset_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+def _set_page_headers(response: Response, next_cursor: Optional[str], total: int) -> None:
+    """通过响应头返回下一页游标和总数（列表接口的响应体保持为数组）"""
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
 @router.get("/users/friends")
 async def get_friends(
+    request: Request,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取当前用户的好友列表"""
-    result = await db.execute(
-        select(User, UserProfile)
-        .outerjoin(UserProfile)
-        .join(Friendship, User.id == Friendship.friend_id)
-        .where(Friendship.user_id == current_user.id)
-    )
-    friends = result.all()
+    """
+    获取当前用户的好友列表
+    按成为好友的时间倒序分页，下一页游标和好友总数分别在 X-Next-Cursor、X-Total-Count 响应头中
+    支持 If-None-Match 条件请求，好友列表未变化时返回 304
+    在线状态变化频繁且不计入 ETag，列表中的 online_status 只是返回时的快照，最新状态通过 /presence/friends 获取
+    """
+    check_limit(limit)
+    stats = await _get_user_stats(db, current_user.id)
+    etag = make_etag("friends", current_user.id, stats.friends_version, limit, cursor)
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    friends, next_cursor = await _get_friend_page(db, current_user.id, limit, cursor)
+    _set_page_headers(response, next_cursor, stats.friends_count)
+    
+    # 批量获取好友在线状态（内存查询）
+    statuses = presence_manager.resolve_many(user for _, user, _ in friends)
     
     return [
         {
@@ -114,9 +310,10 @@ async def get_friends(
                 "avatar_url": profile.avatar_url if profile else None,
                 "bio": profile.bio if profile else None,
                 "gender": profile.gender if profile else None
-            }
+            },
+            "online_status": statuses[user.id]
         }
-        for user, profile in friends
+        for _, user, profile in friends
     ]
 
 class FriendListAccess(BaseModel):
@@ -127,28 +324,35 @@ class UserIdentifier(BaseModel):
     """用户标识请求模型"""
     identifier: str  # 用户名或邮箱
     root: str
+    limit: int = DEFAULT_PAGE_SIZE  # 每页数量
+    cursor: Optional[str] = None  # 上一页返回的 X-Next-Cursor
 
 @router.post("/get_user_friends", dependencies=[])
 async def get_user_friends(
     user_info: UserIdentifier,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取指定用户的好友列表"""
+    """
+    获取指定用户的好友列表
+    按成为好友的时间倒序分页，下一页游标和好友总数分别在 X-Next-Cursor、X-Total-Count 响应头中
+    """
     # 验证访问权限
     if user_info.root != "azyasaxi":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无访问权限"
         )
+    check_limit(user_info.limit)
 
     # 查找用户（支持用户名或邮箱）
     result = await db.execute(
         select(User).where(
             or_(
                 User.username == user_info.identifier,
-                User.email == user_info.identifier
+                email_lookup(user_info.identifier)
             )
-        )
+        ).order_by(email_exact_first(user_info.identifier))
     )
     user = result.scalars().first()
     
@@ -158,14 +362,10 @@ async def get_user_friends(
             detail="用户不存在"
         )
 
-    # 获取该用户的好友列表
-    result = await db.execute(
-        select(User, UserProfile)
-        .outerjoin(UserProfile)
-        .join(Friendship, User.id == Friendship.friend_id)
-        .where(Friendship.user_id == user.id)
-    )
-    friends = result.all()
+    # 获取该用户的一页好友
+    friends, next_cursor = await _get_friend_page(db, user.id, user_info.limit, user_info.cursor)
+    stats = await _get_user_stats(db, user.id)
+    _set_page_headers(response, next_cursor, stats.friends_count)
     
     return [
         {
@@ -178,43 +378,82 @@ async def get_user_friends(
                 "gender": profile.gender if profile else None
             }
         }
-        for friend, profile in friends
+        for _, friend, profile in friends
     ]
 
-# 获取好友申请列表
-@router.get("/friend-requests")
-async def get_friend_requests(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def _get_request_page(
+    db: AsyncSession,
+    owner_column,
+    other_column,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str]
 ):
-    """获取当前用户的好友申请列表"""
-    # 获取收到的申请
-    received_result = await db.execute(
+    """
+    按申请时间倒序获取一页待处理的好友申请
+    :param owner_column: 当前用户所在的列（receiver_id 或 sender_id）
+    :param other_column: 对方用户所在的列
+    :return: ((申请, 对方用户, 对方资料) 列表, 下一页游标)
+    """
+    result = await db.execute(
         select(FriendRequest, User, UserProfile)
-        .join(User, FriendRequest.sender_id == User.id)
+        .join(User, other_column == User.id)
         .outerjoin(UserProfile, User.id == UserProfile.user_id)
         .where(
             and_(
-                FriendRequest.receiver_id == current_user.id,
-                FriendRequest.status == "pending"
+                owner_column == user_id,
+                FriendRequest.status == "pending",
+                keyset_before(FriendRequest.created_at, FriendRequest.id, cursor)
             )
         )
+        .order_by(FriendRequest.created_at.desc(), FriendRequest.id.desc())
+        .limit(limit + 1)
+    )
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_keyset_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+# 获取好友申请列表
+@router.get("/friend-requests")
+async def get_friend_requests(
+    request: Request,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    received_cursor: Optional[str] = None,
+    sent_cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取当前用户的好友申请列表
+    收到的和发送的申请分别按申请时间倒序分页，使用各自的游标获取下一页
+    支持 If-None-Match 条件请求，申请列表未变化时返回 304
+    """
+    check_limit(limit)
+    stats = await _get_user_stats(db, current_user.id)
+    etag = make_etag(
+        "friend-requests", current_user.id, stats.requests_version,
+        limit, received_cursor, sent_cursor
+    )
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    # 获取收到的申请
+    received, received_next = await _get_request_page(
+        db, FriendRequest.receiver_id, FriendRequest.sender_id,
+        current_user.id, limit, received_cursor
     )
-    received = received_result.all()
 
     # 获取发送的申请
-    sent_result = await db.execute(
-        select(FriendRequest, User, UserProfile)
-        .join(User, FriendRequest.receiver_id == User.id)
-        .outerjoin(UserProfile, User.id == UserProfile.user_id)
-        .where(
-            and_(
-                FriendRequest.sender_id == current_user.id,
-                FriendRequest.status == "pending"
-            )
-        )
+    sent, sent_next = await _get_request_page(
+        db, FriendRequest.sender_id, FriendRequest.receiver_id,
+        current_user.id, limit, sent_cursor
     )
-    sent = sent_result.all()
 
     return {
         "received": [
@@ -242,7 +481,11 @@ async def get_friend_requests(
                 "created_at": req.created_at
             }
             for req, user, profile in sent
-        ]
+        ],
+        "received_total": stats.received_requests_count,
+        "sent_total": stats.sent_requests_count,
+        "received_next_cursor": received_next,
+        "sent_next_cursor": sent_next
     }
 
 @router.post("/friend-requests")
@@ -258,15 +501,15 @@ async def create_friend_request(
             detail="必须提供用户名或邮箱"
         )
 
-    # 查找接收者
-    query = select(User)
+    # 查找接收者（只取需要的列）
+    query = select(User.id, User.username)
     if request.username:
         query = query.where(User.username == request.username)
     else:
-        query = query.where(User.email == request.email)
+        query = query.where(email_lookup(request.email)).order_by(email_exact_first(request.email))
 
     result = await db.execute(query)
-    receiver = result.scalars().first()
+    receiver = result.first()
 
     if not receiver:
         raise HTTPException(
@@ -280,68 +523,174 @@ async def create_friend_request(
             detail="不能添加自己为好友"
         )
 
-    # 检查是否已经是好友
-    result = await db.execute(
-        select(Friendship).where(
-            or_(
-                and_(
-                    Friendship.user_id == current_user.id,
-                    Friendship.friend_id == receiver.id
-                ),
-                and_(
-                    Friendship.user_id == receiver.id,
-                    Friendship.friend_id == current_user.id
+    # 创建好友申请：已是好友时不插入，重复的待处理申请由部分唯一索引 ux_friend_requests_pending 拦截
+    now = datetime.now(timezone.utc)
+    try:
+        result = await db.execute(
+            sqlite_insert(FriendRequest)
+            .from_select(
+                ["sender_id", "receiver_id", "status", "created_at", "updated_at"],
+                select(
+                    literal(current_user.id),
+                    literal(receiver.id),
+                    literal("pending"),
+                    literal(now, DateTime),
+                    literal(now, DateTime)
+                ).where(
+                    ~exists().where(
+                        and_(
+                            Friendship.user_id == current_user.id,
+                            Friendship.friend_id == receiver.id
+                        )
+                    )
                 )
             )
+            .on_conflict_do_nothing()
+            .returning(FriendRequest.id)
         )
-    )
-    if result.scalars().first():
+        request_id = result.scalar()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="已经是好友关系"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"发送申请失败: {str(e)}"
         )
-    
-    # 检查是否已经有待处理的申请
-    result = await db.execute(
-        select(FriendRequest).where(
-            and_(
-                FriendRequest.sender_id == current_user.id,
-                FriendRequest.receiver_id == receiver.id,
-                FriendRequest.status == "pending"
+
+    if request_id is None:
+        # 没有插入时区分原因：已经是好友，或已有待处理的申请
+        if await friendship_cache.are_friends(db, current_user.id, receiver.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="已经是好友关系"
             )
-        )
-    )
-    if result.scalars().first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="已经发送过好友申请"
         )
-    
-    # 创建好友申请
-    friend_request = FriendRequest(
-        sender_id=current_user.id,
-        receiver_id=receiver.id,
-        status="pending"
+
+    return {
+        "message": "好友申请已发送",
+        "request_id": request_id,
+        "receiver": {
+            "id": receiver.id,
+            "username": receiver.username
+        }
+    }
+
+def _publish_friendship(event_type: str, user_id: int, friend_id: int) -> None:
+    """
+    通知所有工作进程好友关系的变化（提交成功后调用），各进程据此更新好友缓存和好友关系图
+    :param event_type: friendship.added 或 friendship.removed
+    :param user_id: 用户ID
+    :param friend_id: 好友ID
+    """
+    event_bus.publish([], {"type": event_type, "user_id": user_id, "friend_id": friend_id})
+
+async def _insert_friendships(db: AsyncSession, pairs: List[tuple]) -> None:
+    """
+    用一条批量插入语句写入好友关系的两个方向，已存在的记录会被忽略
+    :param db: 数据库会话
+    :param pairs: (申请人ID, 接收人ID) 列表
+    """
+    if not pairs:
+        return
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        insert(Friendship).prefix_with("OR IGNORE"),
+        [
+            {"user_id": a, "friend_id": b, "created_at": now}
+            for sender_id, receiver_id in pairs
+            for a, b in ((sender_id, receiver_id), (receiver_id, sender_id))
+        ]
     )
+
+@router.post("/friend-requests/batch")
+async def handle_friend_requests_batch(
+    batch: FriendRequestBatchAction,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量处理好友申请（同一个事务内接受或拒绝多条申请）
+    返回每条申请的处理结果: accept / reject / not_found（不存在或不是发给自己的）/ already_processed
+    """
+    if batch.action not in ["accept", "reject"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的操作"
+        )
+    request_ids = list(dict.fromkeys(batch.request_ids))
+    if not request_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="申请ID列表不能为空"
+        )
+    if len(request_ids) > MAX_BATCH_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多处理{MAX_BATCH_REQUESTS}条申请"
+        )
     
     try:
-        db.add(friend_request)
+        # 一次查询取出所有申请
+        result = await db.execute(
+            select(FriendRequest.id, FriendRequest.status).where(
+                and_(
+                    FriendRequest.id.in_(request_ids),
+                    FriendRequest.receiver_id == current_user.id
+                )
+            )
+        )
+        found = dict(result.all())
+        
+        # 只更新仍处于待处理状态的申请，RETURNING 返回实际被更新的记录（避免与并发处理冲突）
+        result = await db.execute(
+            update(FriendRequest)
+            .where(
+                and_(
+                    FriendRequest.id.in_([rid for rid, st in found.items() if st == "pending"]),
+                    FriendRequest.receiver_id == current_user.id,
+                    FriendRequest.status == "pending"
+                )
+            )
+            .values(status=batch.action, updated_at=datetime.now(timezone.utc))
+            .returning(FriendRequest.id, FriendRequest.sender_id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = dict(result.all())
+        
+        pairs = []
+        if batch.action == "accept":
+            pairs = [(sender_id, current_user.id) for sender_id in set(updated.values())]
+            await _insert_friendships(db, pairs)
+        
         await db.commit()
-        await db.refresh(friend_request)
-        return {
-            "message": "好友申请已发送",
-            "request_id": friend_request.id,
-            "receiver": {
-                "id": receiver.id,
-                "username": receiver.username
-            }
-        }
     except Exception as e:
         await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"发送申请失败: {str(e)}"
+            detail=f"批量处理申请失败: {str(e)}"
         )
+    
+    for sender_id, receiver_id in pairs:
+        _publish_friendship("friendship.added", sender_id, receiver_id)
+    
+    results = []
+    for request_id in request_ids:
+        if request_id in updated:
+            outcome = batch.action
+        elif request_id in found:
+            outcome = "already_processed"
+        else:
+            outcome = "not_found"
+        results.append({"request_id": request_id, "result": outcome})
+    
+    return {
+        "message": f"已处理{len(updated)}条好友申请",
+        "processed": len(updated),
+        "results": results
+    }
 
 @router.put("/friend-requests/{request_id}")
 async def handle_friend_request(
@@ -379,19 +728,12 @@ async def handle_friend_request(
         friend_request.status = action.action
         
         if action.action == "accept":
-            # 创建好友关系
-            friendship1 = Friendship(
-                user_id=friend_request.sender_id,
-                friend_id=friend_request.receiver_id
-            )
-            friendship2 = Friendship(
-                user_id=friend_request.receiver_id,
-                friend_id=friend_request.sender_id
-            )
-            db.add(friendship1)
-            db.add(friendship2)
+            # 创建双向好友关系
+            await _insert_friendships(db, [(friend_request.sender_id, friend_request.receiver_id)])
         
         await db.commit()
+        if action.action == "accept":
+            _publish_friendship("friendship.added", friend_request.sender_id, friend_request.receiver_id)
         return {"message": f"好友申请已{action.action}"}
     except Exception as e:
         await db.rollback()
@@ -420,21 +762,7 @@ async def delete_friend(
             )
 
         # 检查是否为好友关系
-        result = await db.execute(
-            select(Friendship).where(
-                or_(
-                    and_(
-                        Friendship.user_id == current_user.id,
-                        Friendship.friend_id == friend.id
-                    ),
-                    and_(
-                        Friendship.user_id == friend.id,
-                        Friendship.friend_id == current_user.id
-                    )
-                )
-            )
-        )
-        if not result.scalars().first():
+        if not await friendship_cache.are_friends(db, current_user.id, friend.id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="该用户不是你的好友"
@@ -456,6 +784,7 @@ async def delete_friend(
             )
         )
         await db.commit()
+        _publish_friendship("friendship.removed", current_user.id, friend.id)
         return {"message": "好友删除成功"}
     except Exception as e:
         await db.rollback()
@@ -466,10 +795,21 @@ async def delete_friend(
 
 @router.get("/users/profile")
 async def get_user_profile(
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取当前用户的资料"""
+    """
+    获取当前用户的资料
+    支持 If-None-Match 条件请求，资料未变化时返回 304
+    """
+    stats = await _get_user_stats(db, current_user.id)
+    etag = make_etag("profile", current_user.id, stats.profile_version)
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+
     result = await db.execute(
         select(UserProfile)
         .where(UserProfile.user_id == current_user.id)
@@ -528,6 +868,7 @@ async def update_user_profile(
         
         await db.commit()
         await db.refresh(profile)
+        user_cache.invalidate_user(current_user.id)
         
         return {
             "message": "资料更新成功",
@@ -549,28 +890,55 @@ async def update_user_profile(
 @router.get("/users/search")
 async def search_users(
     query: str,
-    db: AsyncSession = Depends(get_db)
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_user)
 ):
-    """搜索用户（通过用户名或邮箱）"""
-    try:
-        result = await db.execute(
-            select(User, UserProfile)
-            .outerjoin(UserProfile)
-            .where(
-                or_(
-                    User.username.ilike(f"%{query}%"),
-                    User.email.ilike(f"%{query}%")
-                )
-            )
+    """
+    搜索用户（通过用户名、邮箱或个人简介）
+    结果按相关度排序，用户名前缀匹配优先；返回的 next_cursor 用于获取下一页
+    登录用户的搜索结果附带与每个用户的共同好友数
+    """
+    query = query.strip()
+    if not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="搜索关键词不能为空"
+        )
+    if not 1 <= limit <= 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit 必须在1到50之间"
         )
-        users = result.all()
+    
+    offset = 0
+    if cursor:
+        position = decode_cursor(cursor)
+        if position.get("q") != query or not isinstance(position.get("offset"), int):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="分页游标与搜索关键词不匹配"
+            )
+        offset = position["offset"]
+    
+    try:
+        # 多取一条用于判断是否还有下一页
+        users = await user_search.search(db, query, limit + 1, offset)
+        has_more = len(users) > limit
+        users = users[:limit]
         
         if not users:
             return {
                 "message": "未找到匹配的用户",
-                "users": []
+                "users": [],
+                "next_cursor": None
             }
         
+        mutual_counts = friend_graph.mutual_counts(
+            current_user.id, [user.id for user, _ in users]
+        ) if current_user else {}
+        
         return {
             "message": "查询成功",
             "users": [
@@ -581,10 +949,12 @@ async def search_users(
                     "profile": {
                         "avatar_url": profile.avatar_url if profile else None,
                         "gender": profile.gender if profile else None
-                    } if profile else None
+                    } if profile else None,
+                    "mutual_friends_count": mutual_counts.get(user.id)
                 }
                 for user, profile in users
-            ]
+            ],
+            "next_cursor": encode_cursor({"q": query, "offset": offset + limit}) if has_more else None
         }
         
     except Exception as e:
@@ -608,9 +978,10 @@ async def get_user_info(
             .where(
                 or_(
                     User.username == query,
-                    User.email == query
+                    email_lookup(query)
                 )
             )
+            .order_by(email_exact_first(query))
         )
         user_info = result.first()
         
@@ -623,22 +994,7 @@ async def get_user_info(
         target_user, target_profile = user_info
         
         # 检查是否为好友关系
-        result = await db.execute(
-            select(Friendship).where(
-                or_(
-                    and_(
-                        Friendship.user_id == current_user.id,
-                        Friendship.friend_id == target_user.id
-                    ),
-                    and_(
-                        Friendship.user_id == target_user.id,
-                        Friendship.friend_id == current_user.id
-                    )
-                )
-            )
-        )
-        
-        if not result.scalars().first():
+        if not await friendship_cache.are_friends(db, current_user.id, target_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="只能查看好友的详细信息"
@@ -651,6 +1007,7 @@ async def get_user_info(
             .where(Friendship.user_id == target_user.id)
         )
         friends = friend_result.scalars().all()
+        friend_statuses = presence_manager.resolve_many(friends)
         
         return {
             "message": "查询成功",
@@ -664,14 +1021,13 @@ async def get_user_info(
                     "gender": target_profile.gender if target_profile else None,
                     "bio": target_profile.bio if target_profile else None
                 } if target_profile else None,
-                "online_status": {
-                    "is_online": target_user.is_online,
-                    "last_active": target_user.last_active.isoformat() if target_user.last_active else None
-                },
+                "online_status": presence_manager.resolve(target_user),
+                "mutual_friends_count": friend_graph.mutual_count(current_user.id, target_user.id),
                 "friends": [
                     {
                         "id": friend.id,
-                        "username": friend.username
+                        "username": friend.username,
+                        "is_online": friend_statuses[friend.id]["is_online"]
                     }
                     for friend in friends
                 ]
@@ -685,3 +1041,147 @@ async def get_user_info(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取用户信息失败: {str(e)}"
         )
+
+@router.post("/users/batch")
+async def get_users_batch(
+    lookup: UserBatchLookup,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量获取用户的公开资料（用于会话列表、群组成员等场景）
+    查询次数固定，与用户数无关；好友（及本人）额外返回邮箱、简介和在线状态
+    """
+    user_ids = list(dict.fromkeys(lookup.ids))
+    usernames = list(dict.fromkeys(lookup.usernames))
+    if not user_ids and not usernames:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="用户ID和用户名不能同时为空"
+        )
+    if len(user_ids) + len(usernames) > MAX_BATCH_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多查询{MAX_BATCH_USERS}个用户"
+        )
+
+    # 一次查询取出所有用户及资料
+    result = await db.execute(
+        select(User, UserProfile)
+        .outerjoin(UserProfile)
+        .where(or_(User.id.in_(user_ids), User.username.in_(usernames)))
+    )
+    # 按请求中的顺序返回
+    order = {("id", user_id): index for index, user_id in enumerate(user_ids)}
+    order.update({("username", name): len(user_ids) + index for index, name in enumerate(usernames)})
+    rows = sorted(result.all(), key=lambda row: min(
+        order.get(("id", row[0].id), len(order)),
+        order.get(("username", row[0].username), len(order))
+    ))
+    found_ids = [user.id for user, _ in rows]
+
+    # 一次查询取出与这些用户之间待处理的好友申请
+    pending = {}
+    if found_ids:
+        result = await db.execute(
+            select(FriendRequest.sender_id, FriendRequest.receiver_id).where(
+                and_(
+                    FriendRequest.status == "pending",
+                    or_(
+                        and_(FriendRequest.sender_id == current_user.id, FriendRequest.receiver_id.in_(found_ids)),
+                        and_(FriendRequest.receiver_id == current_user.id, FriendRequest.sender_id.in_(found_ids))
+                    )
+                )
+            )
+        )
+        for sender_id, receiver_id in result:
+            if sender_id == current_user.id:
+                pending[receiver_id] = "sent"
+            else:
+                pending[sender_id] = "received"
+
+    # 好友关系、共同好友数和在线状态均来自内存
+    friend_ids = await friendship_cache.get_friend_ids(db, current_user.id)
+    mutual_counts = friend_graph.mutual_counts(current_user.id, found_ids)
+    users = []
+    for user, profile in rows:
+        visible = user.id == current_user.id or user.id in friend_ids
+        users.append({
+            "id": user.id,
+            "username": user.username,
+            "email": user.email if visible else None,
+            "profile": {
+                "avatar_url": profile.avatar_url,
+                "background_url": profile.background_url if visible else None,
+                "gender": profile.gender,
+                "bio": profile.bio if visible else None
+            } if profile else None,
+            "online_status": presence_manager.resolve(user) if visible else None,
+            "is_friend": user.id in friend_ids,
+            "friend_request": pending.get(user.id),  # sent / received / None
+            "mutual_friends_count": mutual_counts.get(user.id, 0) if user.id != current_user.id else None
+        })
+
+    found_usernames = {user.username for user, _ in rows}
+    found_id_set = set(found_ids)
+    return {
+        "message": "查询成功",
+        "users": users,
+        "not_found": {
+            "ids": [user_id for user_id in user_ids if user_id not in found_id_set],
+            "usernames": [username for username in usernames if username not in found_usernames]
+        }
+    }
+
+@router.get("/users/recommendations")
+async def get_friend_recommendations(
+    limit: int = 10,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取可能认识的人（好友的好友，按共同好友数排序，排除已有待处理申请的用户）"""
+    if not 1 <= limit <= 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit 必须在1到50之间"
+        )
+    
+    result = await db.execute(
+        select(FriendRequest.sender_id, FriendRequest.receiver_id).where(
+            and_(
+                or_(
+                    FriendRequest.sender_id == current_user.id,
+                    FriendRequest.receiver_id == current_user.id
+                ),
+                FriendRequest.status == "pending"
+            )
+        )
+    )
+    pending = {uid for row in result for uid in row}
+    suggestions = friend_graph.suggest(current_user.id, limit, exclude=pending)
+    if not suggestions:
+        return {"message": "暂无推荐", "users": []}
+    
+    result = await db.execute(
+        select(User, UserProfile)
+        .outerjoin(UserProfile)
+        .where(User.id.in_([user_id for user_id, _ in suggestions]))
+    )
+    users = {user.id: (user, profile) for user, profile in result.all()}
+    
+    return {
+        "message": "查询成功",
+        "users": [
+            {
+                "id": users[user_id][0].id,
+                "username": users[user_id][0].username,
+                "profile": {
+                    "avatar_url": users[user_id][1].avatar_url,
+                    "gender": users[user_id][1].gender
+                } if users[user_id][1] else None,
+                "mutual_friends_count": mutual_count
+            }
+            for user_id, mutual_count in suggestions
+            if user_id in users
+        ]
+    }
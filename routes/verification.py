@@ -5,14 +5,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 import random
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
-from models import User
+from models import User, normalize_email
 from dependencies import get_db
+from services import verification_store, mail_queue, MailQueueFull
 
 # 创建路由器
 router = APIRouter(tags=["验证码"])
@@ -20,10 +20,6 @@ router = APIRouter(tags=["验证码"])
 # 创建线程池执行器
 executor = ThreadPoolExecutor()
 
-# 内存中存储验证码及其过期时间
-# 结构: {email: {"code": "123456", "expiry_time": datetime}}
-verification_codes = {}
-
 class EmailRequest(BaseModel):
     """邮箱请求模型"""
     email: str
@@ -41,44 +37,28 @@ async def generate_and_return_code(email: str) -> str:
         lambda: "".join(random.choices("0123456789", k=6))
     )
     
-    # 设置验证码过期时间（1分钟）
-    expiry_time = datetime.now(timezone.utc) + timedelta(minutes=1)
-    
-    # 存储验证码信息
-    verification_codes[email] = {
-        "code": code,
-        "expiry_time": expiry_time
-    }
+    # 存储验证码信息（过期时间由验证码存储控制）
+    await verification_store.issue(email, code)
     
     print(f"验证码已生成: {code}, 请求邮箱为：{email}")
     return code
 
-def verify_code(email: str, code: str) -> bool:
+async def verify_code(email: str, code: str) -> bool:
     """
     验证邮箱验证码
     :param email: 用户邮箱
     :param code: 用户提供的验证码
     :return: 验证码是否有效
     """
-    # 检查邮箱是否有验证码记录
-    if email not in verification_codes or not verification_codes[email]["code"]:
-        return False
-    
-    # 检查验证码是否过期
-    if verification_codes[email]["expiry_time"] < datetime.now(timezone.utc):
-        del verification_codes[email]
-        return False
-    
-    # 检查验证码是否匹配
-    return code == verification_codes[email]["code"]
+    # 过期或失败次数过多的验证码均视为无效
+    return await verification_store.verify(email, code)
 
-def clear_verification_code(email: str) -> None:
+async def clear_verification_code(email: str) -> None:
     """
     清理验证码
     :param email: 用户邮箱
     """
-    if email in verification_codes:
-        del verification_codes[email]
+    await verification_store.clear(email)
 
 @router.post("/get_verification_code")
 async def get_verification_code(request: EmailRequest, db: AsyncSession = Depends(get_db)):
@@ -88,9 +68,16 @@ async def get_verification_code(request: EmailRequest, db: AsyncSession = Depend
     :param db: 数据库会话
     :return: 包含验证码的响应
     """
+    # 邮箱会写入邮件头，包含换行符的地址无法发送
+    if "\r" in request.email or "\n" in request.email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="邮箱格式不正确",
+        )
+
     # 检查邮箱是否已注册
     result = await db.execute(
-        select(User).where(User.email.ilike(request.email))
+        select(User).where(User.email_normalized == normalize_email(request.email))
     )
     existing_user = result.scalars().first()
     
@@ -103,7 +90,33 @@ async def get_verification_code(request: EmailRequest, db: AsyncSession = Depend
     # 生成验证码
     code = await generate_and_return_code(request.email)
     
-    # 返回验证码（在实际生产环境中，应该通过邮件发送而不是直接返回）
+    # 配置了SMTP时通过邮件发送，入队后立即返回
+    if mail_queue.enabled:
+        try:
+            mail_queue.enqueue(
+                to=request.email,
+                subject="注册验证码",
+                body=f"您的验证码是 {code}，有效期 {verification_store.ttl} 秒。"
+            )
+        except MailQueueFull:
+            await clear_verification_code(request.email)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": "5"},
+            )
+        except ValueError:
+            await clear_verification_code(request.email)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="邮箱格式不正确",
+            )
+        return {
+            "message": "验证码已发送",
+            "Email": request.email
+        }
+    
+    # 未配置SMTP时直接返回验证码（仅用于开发环境）
     return {
         "message": "验证码已生成",
         "code": code,
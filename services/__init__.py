@@ -0,0 +1,36 @@
+"""
+services 包
+包含路由共享的基础服务（缓存、后台任务等）
+"""
+from .user_cache import user_cache
+from .password_hasher import password_hasher, PasswordHasherBusy
+from .presence import presence_manager
+from .verification_store import verification_store
+from .mailer import mail_queue, MailQueueFull
+from .user_search import user_search
+from .message_search import message_search
+from .friendship_cache import friendship_cache
+from .friend_graph import friend_graph
+from .realtime import connection_hub
+from .event_bus import event_bus
+from .message_writer import message_writer, MessageWriterBusy
+from .message_purge import message_purge
+
+__all__ = [
+    'user_cache',
+    'password_hasher',
+    'PasswordHasherBusy',
+    'presence_manager',
+    'verification_store',
+    'mail_queue',
+    'MailQueueFull',
+    'user_search',
+    'message_search',
+    'friendship_cache',
+    'friend_graph',
+    'connection_hub',
+    'event_bus',
+    'message_writer',
+    'MessageWriterBusy',
+    'message_purge',
+]
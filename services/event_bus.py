@@ -0,0 +1,275 @@
+"""
+事件总线模块
+将聊天事件分发给所有工作进程中的 WebSocket 连接，并在每个工作进程中执行订阅的处理函数（同步进程内缓存）
+支持进程内和 SQLite 追加日志两种后端
+SQLite 后端不依赖外部服务: 各进程把事件批量追加到同一个日志文件，并轮询读取其他进程写入的新事件
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    EVENT_BUS_BACKEND,
+    EVENT_BUS_DB_PATH,
+    EVENT_BUS_POLL_INTERVAL_SECONDS,
+    EVENT_BUS_BATCH_SIZE,
+    EVENT_BUS_RETENTION_SECONDS,
+)
+from .realtime import connection_hub
+from .friendship_cache import friendship_cache
+from .friend_graph import friend_graph
+from .user_cache import user_cache
+
+# 事件投递函数: (接收事件的用户ID, 事件内容)
+Deliver = Callable[[List[int], Dict], object]
+# 事件处理函数: (事件内容)
+Handler = Callable[[Dict], object]
+
+class EventBus:
+    """事件总线基类"""
+
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+        # 事件类型到处理函数的映射，每个工作进程收到该类型的事件时都会执行
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def publish(self, user_ids: Iterable[int], event: Dict) -> None:
+        """
+        发布事件，立即返回
+        :param user_ids: 接收事件的用户ID（只需通知各进程的处理函数时为空）
+        :param event: 事件内容（可JSON序列化）
+        """
+        raise NotImplementedError
+
+    def subscribe(self, event_type: str, handler: Handler) -> None:
+        """
+        订阅某种类型的事件，本进程和其他进程发布的事件都会在本进程中执行处理函数
+        :param event_type: 事件类型
+        :param handler: 处理函数（应当可以重复执行）
+        """
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def _dispatch(self, user_ids: List[int], event: Dict) -> None:
+        """执行本进程的处理函数，并投递给用户的连接"""
+        for handler in self._handlers.get(event.get("type"), ()):
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"处理事件 {event.get('type')} 失败: {e}")
+        if user_ids:
+            self.deliver(user_ids, event)
+
+    async def start(self) -> None:
+        """启动后台任务"""
+        pass
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        pass
+
+    def stats(self) -> Dict:
+        """获取事件总线统计"""
+        return {
+            "backend": type(self).__name__,
+            "published": self.published,
+            "delivered": self.delivered
+        }
+
+class LocalEventBus(EventBus):
+    """进程内后端，只投递给本进程的连接（单工作进程部署）"""
+
+    def publish(self, user_ids: Iterable[int], event: Dict) -> None:
+        self.published += 1
+        self._dispatch(list(user_ids), event)
+        self.delivered += 1
+
+class SQLiteLogEventBus(EventBus):
+    """
+    SQLite 追加日志后端，多个 uvicorn 工作进程共享同一个日志文件
+    本进程发布的事件直接投递给本地连接，同时批量写入日志；后台任务轮询日志，投递其他进程写入的事件
+    """
+
+    def __init__(
+        self,
+        deliver: Deliver,
+        path: str = EVENT_BUS_DB_PATH,
+        poll_interval: float = EVENT_BUS_POLL_INTERVAL_SECONDS,
+        batch_size: int = EVENT_BUS_BATCH_SIZE,
+        retention: float = EVENT_BUS_RETENTION_SECONDS
+    ):
+        super().__init__(deliver)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention = retention
+        # 区分事件来源，避免重复投递本进程发布的事件
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._pending: List[Tuple[str, str, float]] = []
+        self._last_id = 0
+        self._last_prune = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        # sqlite3 是阻塞的，所有数据库操作都在这个单线程执行器中完成
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-bus")
+        self._task: Optional[asyncio.Task] = None
+        # 有待写入的事件时唤醒后台任务，不必等到下一个轮询周期
+        self._wakeup: Optional[asyncio.Event] = None
+        self.received = 0
+        self.written = 0
+
+    def publish(self, user_ids: Iterable[int], event: Dict) -> None:
+        user_ids = list(user_ids)
+        self.published += 1
+        self._dispatch(user_ids, event)
+        self.delivered += 1
+        if self._task is not None:
+            payload = json.dumps({"users": user_ids, "event": event}, ensure_ascii=False, default=str)
+            self._pending.append((self.origin, payload, time.time()))
+            self._wakeup.set()
+
+    def _open(self) -> int:
+        """打开日志文件，返回当前最新的事件ID（只投递启动之后的事件）"""
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, "
+            "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn = conn
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_events").fetchone()[0]
+
+    def _write(self, rows: List[Tuple[str, str, float]]) -> None:
+        """将一批事件写入日志，并定期清理过期事件（在执行器线程中调用）"""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO chat_events (origin, payload, created_at) VALUES (?, ?, ?)", rows
+            )
+            now = time.time()
+            if now - self._last_prune >= self.retention:
+                conn.execute("DELETE FROM chat_events WHERE created_at < ?", (now - self.retention,))
+                self._last_prune = now
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _read(self, after_id: int) -> List[Tuple[int, str, str]]:
+        """读取指定ID之后的一批事件（在执行器线程中调用）"""
+        return self._conn.execute(
+            "SELECT id, origin, payload FROM chat_events WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, self.batch_size)
+        ).fetchall()
+
+    async def _run(self) -> None:
+        """后台任务：写入本进程积累的事件，并读取其他进程的新事件（每个轮询周期或有新事件发布时执行）"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self._pending:
+                    rows, self._pending = self._pending, []
+                    try:
+                        await loop.run_in_executor(self._executor, self._write, rows)
+                    except Exception:
+                        # 写入失败时保留事件，下个周期重试
+                        self._pending[:0] = rows
+                        raise
+                    self.written += len(rows)
+
+                while True:
+                    rows = await loop.run_in_executor(self._executor, self._read, self._last_id)
+                    for event_id, origin, payload in rows:
+                        self._last_id = event_id
+                        if origin == self.origin:
+                            continue
+                        data = json.loads(payload)
+                        self._dispatch(data["users"], data["event"])
+                        self.received += 1
+                        self.delivered += 1
+                    if len(rows) < self.batch_size:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"事件总线读写失败: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self) -> None:
+        if self._task is None:
+            loop = asyncio.get_running_loop()
+            self._last_id = await loop.run_in_executor(self._executor, self._open)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            loop = asyncio.get_running_loop()
+            # 写入剩余事件后关闭
+            if self._pending:
+                rows, self._pending = self._pending, []
+                try:
+                    await loop.run_in_executor(self._executor, self._write, rows)
+                    self.written += len(rows)
+                except Exception as e:
+                    print(f"事件总线写入失败: {e}")
+            await loop.run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update({
+            "origin": self.origin,
+            "written": self.written,
+            "received": self.received,
+            "pending_writes": len(self._pending),
+            "last_event_id": self._last_id,
+            "poll_interval": self.poll_interval
+        })
+        return stats
+
+def create_event_bus() -> EventBus:
+    """根据配置创建事件总线，并订阅需要在每个工作进程中同步的缓存"""
+    if EVENT_BUS_BACKEND == "sqlite":
+        bus = SQLiteLogEventBus(connection_hub.publish)
+    elif EVENT_BUS_BACKEND == "local":
+        bus = LocalEventBus(connection_hub.publish)
+    else:
+        raise ValueError(f"不支持的事件总线后端: {EVENT_BUS_BACKEND}")
+
+    # 好友关系变化后更新每个工作进程的好友缓存和好友关系图，其他进程删除好友后不再按旧数据放行和推荐
+    for cache in (friendship_cache, friend_graph):
+        bus.subscribe(
+            "friendship.added",
+            lambda event, cache=cache: cache.add_friendship(event["user_id"], event["friend_id"])
+        )
+        bus.subscribe(
+            "friendship.removed",
+            lambda event, cache=cache: cache.remove_friendship(event["user_id"], event["friend_id"])
+        )
+
+    # 用户登出后丢弃每个工作进程缓存的用户快照（其中的 current_token 已失效），并关闭其 WebSocket 连接
+    bus.subscribe("session.revoked", lambda event: user_cache.invalidate_user(event["user_id"]))
+    bus.subscribe("session.revoked", lambda event: connection_hub.close_user(event["user_id"]))
+    return bus
+
+# 创建全局事件总线实例
+event_bus = create_event_bus()
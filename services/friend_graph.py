@@ -0,0 +1,307 @@
+"""
+好友关系图模块
+以压缩稀疏行（CSR）数组在内存中保存好友关系图，用向量化的集合运算计算共同好友数和“可能认识的人”
+启动时从 friendships 表构建，之后的增删（经事件总线同步到每个工作进程）记录在增量层中，积累到一定数量后合并回 CSR
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from config import FRIEND_GRAPH_COMPACT_THRESHOLD
+from models import Friendship
+
+# 将 (用户ID, 好友ID) 编码为单个整数时使用的乘数
+_PAIR_BASE = np.int64(1) << 32
+
+def _csr_from_keys(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由有序、去重的边编码构建 CSR 数组
+    :param keys: 用户ID * _PAIR_BASE + 好友ID
+    :return: (indptr, indices)
+    """
+    rows = keys // _PAIR_BASE
+    cols = keys % _PAIR_BASE
+    size = int(rows[-1]) + 1 if rows.size else 0
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols.astype(np.int32)
+
+def _build_csr(src: np.ndarray, dst: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由边列表构建对称、去重、邻居有序的 CSR 数组
+    :param src: 起点用户ID数组
+    :param dst: 终点用户ID数组
+    :return: (indptr, indices)
+    """
+    src = src.astype(np.int64, copy=False)
+    dst = dst.astype(np.int64, copy=False)
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+    # 排序去重后同一用户的邻居连续且有序
+    keys = np.unique(np.concatenate((src * _PAIR_BASE + dst, dst * _PAIR_BASE + src)))
+    return _csr_from_keys(keys)
+
+class FriendGraph:
+    """基于 CSR 数组的好友关系图"""
+
+    def __init__(self, compact_threshold: int = FRIEND_GRAPH_COMPACT_THRESHOLD):
+        self.compact_threshold = compact_threshold
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        # 增量层: 构建之后新增和删除的邻居（两个方向都会记录）
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._overlay: Optional[np.ndarray] = None
+        self._pending = 0
+        self.loaded = False
+        self.compactions = 0
+
+    @classmethod
+    def from_edges(cls, src: Iterable[int], dst: Iterable[int], **kwargs) -> "FriendGraph":
+        """
+        由边列表直接构建关系图
+        :param src: 起点用户ID序列
+        :param dst: 终点用户ID序列
+        :return: 关系图
+        """
+        graph = cls(**kwargs)
+        graph._indptr, graph._indices = _build_csr(
+            np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        )
+        graph.loaded = True
+        return graph
+
+    async def load(self, conn) -> None:
+        """
+        从 friendships 表构建关系图（启动时调用）
+        :param conn: 异步数据库连接
+        """
+        result = await conn.execute(select(Friendship.user_id, Friendship.friend_id))
+        rows = np.array(result.all(), dtype=np.int64).reshape(-1, 2)
+        self._indptr, self._indices = _build_csr(rows[:, 0], rows[:, 1])
+        self._added.clear()
+        self._removed.clear()
+        self._overlay = None
+        self._pending = 0
+        self.loaded = True
+
+    def _base_neighbors(self, user_id: int) -> np.ndarray:
+        """CSR 中记录的邻居"""
+        if user_id + 1 >= self._indptr.size:
+            return self._indices[:0]
+        return self._indices[self._indptr[user_id]:self._indptr[user_id + 1]]
+
+    def neighbors(self, user_id: int) -> np.ndarray:
+        """
+        获取用户的好友ID（有序数组）
+        :param user_id: 用户ID
+        :return: 好友ID数组
+        """
+        base = self._base_neighbors(user_id)
+        added = self._added.get(user_id)
+        removed = self._removed.get(user_id)
+        if not added and not removed:
+            return base
+        if removed:
+            base = base[~np.isin(base, np.fromiter(removed, dtype=np.int32))]
+        if added:
+            base = np.union1d(base, np.fromiter(added, dtype=np.int32))
+        return base
+
+    def _overlay_ids(self) -> np.ndarray:
+        """有增量变更的用户ID（有序数组，变更后重新生成）"""
+        if self._overlay is None:
+            self._overlay = np.array(sorted(set(self._added) | set(self._removed)), dtype=np.int64)
+        return self._overlay
+
+    def _gather(self, user_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按顺序拼接多个用户的邻居数组
+        没有增量变更的用户直接按 CSR 偏移批量取出，其余逐个合并
+        :return: (拼接后的邻居ID, 每个用户的邻居数)
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        in_range = user_ids + 1 < self._indptr.size
+        starts = np.where(in_range, self._indptr[np.where(in_range, user_ids, 0)], 0)
+        lengths = np.where(in_range, self._indptr[np.where(in_range, user_ids + 1, 0)] - starts, 0)
+
+        overlay = self._overlay_ids()
+        patched = np.flatnonzero(np.isin(user_ids, overlay)) if overlay.size else []
+        if len(patched):
+            lengths[patched] = 0
+
+        # 每个元素的位置 = 所属行的起点 + 在行内的序号
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        values = self._indices[positions]
+        if not len(patched):
+            return values, lengths
+
+        # 将有增量变更的用户按原顺序插回
+        parts, offset = [], 0
+        for index in patched:
+            end = int(offsets[index])
+            parts.append(values[offset:end])
+            neighbors = self.neighbors(int(user_ids[index]))
+            parts.append(neighbors)
+            lengths[index] = neighbors.size
+            offset = end
+        parts.append(values[offset:])
+        return np.concatenate(parts), lengths
+
+    def add_friendship(self, user_id: int, friend_id: int) -> None:
+        """
+        记录新建立的好友关系
+        :param user_id: 用户ID
+        :param friend_id: 好友ID
+        """
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            self._discard(self._removed, a, b)
+            if not self._in_base(a, b):
+                self._added.setdefault(a, set()).add(b)
+        self._record_change()
+
+    def remove_friendship(self, user_id: int, friend_id: int) -> None:
+        """
+        记录被删除的好友关系
+        :param user_id: 用户ID
+        :param friend_id: 好友ID
+        """
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            self._discard(self._added, a, b)
+            if self._in_base(a, b):
+                self._removed.setdefault(a, set()).add(b)
+        self._record_change()
+
+    def _in_base(self, user_id: int, friend_id: int) -> bool:
+        """CSR 中是否记录了这条边"""
+        base = self._base_neighbors(user_id)
+        index = np.searchsorted(base, friend_id)
+        return bool(index < base.size and base[index] == friend_id)
+
+    @staticmethod
+    def _discard(overlay: Dict[int, Set[int]], user_id: int, friend_id: int) -> None:
+        """从增量层中移除一条边"""
+        friends = overlay.get(user_id)
+        if friends is not None:
+            friends.discard(friend_id)
+            if not friends:
+                del overlay[user_id]
+
+    def _record_change(self) -> None:
+        """增量层积累过多时合并回 CSR"""
+        self._overlay = None
+        self._pending += 1
+        if self._pending >= self.compact_threshold:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        将增量层合并进 CSR 数组
+        CSR 的边编码本身有序，只需对增量部分排序后归并，不必重新排序全部边
+        """
+        rows = np.repeat(
+            np.arange(self._indptr.size - 1, dtype=np.int64), np.diff(self._indptr)
+        )
+        keys = rows * _PAIR_BASE + self._indices.astype(np.int64)
+
+        removed = sorted(a * int(_PAIR_BASE) + b for a, friends in self._removed.items() for b in friends)
+        if removed:
+            removed = np.array(removed, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(removed, keys), removed.size - 1)
+            keys = keys[removed[positions] != keys]
+
+        added = sorted(a * int(_PAIR_BASE) + b for a, friends in self._added.items() for b in friends)
+        if added:
+            added = np.array(added, dtype=np.int64)
+            keys = np.insert(keys, np.searchsorted(keys, added), added)
+
+        self._indptr, self._indices = _csr_from_keys(keys)
+        self._added.clear()
+        self._removed.clear()
+        self._overlay = None
+        self._pending = 0
+        self.compactions += 1
+
+    def mutual_count(self, user_id: int, other_id: int) -> int:
+        """
+        计算两个用户的共同好友数
+        :param user_id: 用户ID
+        :param other_id: 另一个用户ID
+        :return: 共同好友数
+        """
+        return int(np.intersect1d(
+            self.neighbors(user_id), self.neighbors(other_id), assume_unique=True
+        ).size)
+
+    def mutual_counts(self, user_id: int, other_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        批量计算某个用户与多个用户的共同好友数
+        :param user_id: 用户ID
+        :param other_ids: 其他用户ID
+        :return: 用户ID到共同好友数的映射
+        """
+        other_ids = list(other_ids)
+        friends = self.neighbors(user_id)
+        if not friends.size or not other_ids:
+            return {other_id: 0 for other_id in other_ids}
+
+        values, lengths = self._gather(np.array(other_ids, dtype=np.int64))
+        # 用布尔掩码标记好友，一次性统计每个用户的邻居中有多少是好友
+        mask = np.zeros(max(int(friends[-1]), int(values.max(initial=0))) + 1, dtype=bool)
+        mask[friends] = True
+        owners = np.repeat(np.arange(len(other_ids)), lengths)
+        counts = np.bincount(owners, weights=mask[values], minlength=len(other_ids))
+        return {other_id: int(count) for other_id, count in zip(other_ids, counts)}
+
+    def suggest(self, user_id: int, limit: int = 10, exclude: Optional[Iterable[int]] = None) -> List[Tuple[int, int]]:
+        """
+        推荐可能认识的人（好友的好友），按共同好友数降序排列
+        :param user_id: 用户ID
+        :param limit: 返回数量
+        :param exclude: 额外排除的用户ID（如已有待处理申请的用户）
+        :return: (用户ID, 共同好友数) 列表
+        """
+        friends = self.neighbors(user_id)
+        if not friends.size:
+            return []
+
+        # 好友的好友（带重复，重复次数即共同好友数）
+        candidates, _ = self._gather(friends)
+        if not candidates.size:
+            return []
+        counts = np.bincount(candidates)
+        if user_id < counts.size:
+            counts[user_id] = 0
+        counts[friends[friends < counts.size]] = 0
+        if exclude is not None:
+            excluded = np.fromiter(exclude, dtype=np.int64)
+            counts[excluded[excluded < counts.size]] = 0
+
+        nonzero = np.flatnonzero(counts)
+        if nonzero.size > limit:
+            # 只保留不低于第 limit 名共同好友数的候选，避免对全部候选排序
+            values = counts[nonzero]
+            threshold = np.partition(values, values.size - limit)[values.size - limit]
+            nonzero = nonzero[values >= threshold]
+        # 共同好友数相同时按用户ID排序，保证结果稳定
+        order = np.lexsort((nonzero, -counts[nonzero]))[:limit]
+        return [(int(uid), int(counts[uid])) for uid in nonzero[order]]
+
+    def stats(self) -> Dict:
+        """获取关系图统计"""
+        return {
+            "loaded": self.loaded,
+            "nodes": int(self._indptr.size - 1),
+            "edges": (
+                int(self._indices.size)
+                + sum(len(friends) for friends in self._added.values())
+                - sum(len(friends) for friends in self._removed.values())
+            ) // 2,
+            "pending_changes": self._pending,
+            "compactions": self.compactions
+        }
+
+# 创建全局好友关系图实例
+friend_graph = FriendGraph()
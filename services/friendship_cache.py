@@ -0,0 +1,126 @@
+"""
+好友关系缓存模块
+按用户懒加载好友ID集合，O(1) 判断两个用户是否为好友，减少对 friendships 表的重复查询
+"""
+from collections import OrderedDict
+from typing import Dict, Set
+
+from sqlalchemy import select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import FRIENDSHIP_CACHE_MAX_USERS
+from models import Friendship
+
+class FriendshipCache:
+    """用户好友集合缓存（LRU淘汰）"""
+
+    def __init__(self, max_users: int = FRIENDSHIP_CACHE_MAX_USERS):
+        self.max_users = max_users
+        # 用户ID到好友ID集合的映射，按最近使用排序
+        self._entries: "OrderedDict[int, Set[int]]" = OrderedDict()
+        # 每个用户的变更版本号，防止加载期间发生的变更被旧数据覆盖
+        self._versions: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get_friend_ids(self, db: AsyncSession, user_id: int) -> Set[int]:
+        """
+        获取用户的好友ID集合，未缓存时从数据库加载
+        :param db: 数据库会话
+        :param user_id: 用户ID
+        :return: 好友ID集合（调用方不应修改）
+        """
+        friend_ids = self._entries.get(user_id)
+        if friend_ids is not None:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return friend_ids
+
+        self.misses += 1
+        version = self._versions.get(user_id, 0)
+        # 兼容只写入了单向记录的旧数据
+        result = await db.execute(
+            union(
+                select(Friendship.friend_id).where(Friendship.user_id == user_id),
+                select(Friendship.user_id).where(Friendship.friend_id == user_id)
+            )
+        )
+        friend_ids = set(result.scalars())
+
+        # 加载期间好友关系发生了变化，本次结果不写入缓存
+        if self._versions.get(user_id, 0) == version and self.max_users > 0:
+            self._entries[user_id] = friend_ids
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return friend_ids
+
+    async def are_friends(self, db: AsyncSession, user_id: int, other_id: int) -> bool:
+        """
+        判断两个用户是否为好友，优先使用已缓存的一方
+        :param db: 数据库会话
+        :param user_id: 用户ID
+        :param other_id: 另一个用户ID
+        :return: 是否为好友
+        """
+        if user_id not in self._entries and other_id in self._entries:
+            user_id, other_id = other_id, user_id
+        return other_id in await self.get_friend_ids(db, user_id)
+
+    def add_friendship(self, user_id: int, friend_id: int) -> None:
+        """
+        记录新建立的好友关系（提交成功后调用）
+        :param user_id: 用户ID
+        :param friend_id: 好友ID
+        """
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            self._bump(a)
+            friend_ids = self._entries.get(a)
+            if friend_ids is not None:
+                friend_ids.add(b)
+
+    def remove_friendship(self, user_id: int, friend_id: int) -> None:
+        """
+        记录被删除的好友关系（提交成功后调用）
+        :param user_id: 用户ID
+        :param friend_id: 好友ID
+        """
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            self._bump(a)
+            friend_ids = self._entries.get(a)
+            if friend_ids is not None:
+                friend_ids.discard(b)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        丢弃某个用户的缓存
+        :param user_id: 用户ID
+        """
+        self._bump(user_id)
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        for user_id in list(self._entries):
+            self._bump(user_id)
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        """获取缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_users": self.max_users,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def _bump(self, user_id: int) -> None:
+        """增加用户的变更版本号"""
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+# 创建全局好友关系缓存实例
+friendship_cache = FriendshipCache()
@@ -0,0 +1,233 @@
+"""
+邮件发送模块
+将待发送邮件放入队列，由后台任务复用SMTP连接批量发送，失败时按指数退避重试
+"""
+import asyncio
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Dict, List, Optional, Set
+
+from config import (
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    SMTP_USE_TLS,
+    MAIL_FROM,
+    MAIL_QUEUE_MAX_SIZE,
+    MAIL_BATCH_SIZE,
+    MAIL_MAX_RETRIES,
+    MAIL_RETRY_BASE_DELAY_SECONDS,
+    MAIL_CONNECTION_IDLE_SECONDS,
+)
+
+class MailQueueFull(Exception):
+    """邮件队列已满"""
+    pass
+
+class MailQueue:
+    """异步邮件发送队列"""
+
+    def __init__(
+        self,
+        host: Optional[str] = SMTP_HOST,
+        port: int = SMTP_PORT,
+        username: Optional[str] = SMTP_USERNAME,
+        password: Optional[str] = SMTP_PASSWORD,
+        use_tls: bool = SMTP_USE_TLS,
+        sender: str = MAIL_FROM,
+        max_size: int = MAIL_QUEUE_MAX_SIZE,
+        batch_size: int = MAIL_BATCH_SIZE,
+        max_retries: int = MAIL_MAX_RETRIES,
+        retry_base_delay: float = MAIL_RETRY_BASE_DELAY_SECONDS,
+        idle_timeout: float = MAIL_CONNECTION_IDLE_SECONDS
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.idle_timeout = idle_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 等待退避重试的任务
+        self._retry_tasks: Set[asyncio.Task] = set()
+        # smtplib 是阻塞的，所有SMTP操作都在这个单线程执行器中完成
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mailer")
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否配置了SMTP服务器"""
+        return bool(self.host)
+
+    def enqueue(self, to: str, subject: str, body: str) -> None:
+        """
+        将邮件放入发送队列，立即返回
+        :param to: 收件人
+        :param subject: 邮件主题
+        :param body: 邮件正文
+        :raises: MailQueueFull 如果队列已满
+        :raises: ValueError 如果收件人无法写入邮件头（如包含换行符）
+        """
+        if self._queue is None:
+            raise RuntimeError("邮件队列尚未启动")
+
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        try:
+            self._queue.put_nowait({"message": message, "attempts": 0})
+        except asyncio.QueueFull:
+            raise MailQueueFull("邮件队列已满")
+
+    def _connect(self) -> smtplib.SMTP:
+        """获取可复用的SMTP连接（在执行器线程中调用）"""
+        if self._smtp is not None:
+            if time.monotonic() - self._last_used < self.idle_timeout:
+                try:
+                    if self._smtp.noop()[0] == 250:
+                        return self._smtp
+                except smtplib.SMTPException:
+                    pass
+            self._close()
+
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        self._smtp = smtp
+        return smtp
+
+    def _close(self) -> None:
+        """关闭SMTP连接（在执行器线程中调用）"""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _send_batch(self, batch: List[Dict]) -> List[Dict]:
+        """
+        通过同一个SMTP连接发送一批邮件（在执行器线程中调用）
+        :return: 发送失败的邮件
+        """
+        failed = []
+        try:
+            smtp = self._connect()
+        except (smtplib.SMTPException, OSError) as e:
+            print(f"连接SMTP服务器失败: {e}")
+            return batch
+
+        for index, item in enumerate(batch):
+            try:
+                smtp.send_message(item["message"])
+            except smtplib.SMTPServerDisconnected:
+                # 连接已断开，本封及后续邮件留待重试
+                self._smtp = None
+                failed.extend(batch[index:])
+                break
+            except smtplib.SMTPRecipientsRefused as e:
+                # 收件人被拒绝属于永久性错误，不再重试
+                print(f"收件人被拒绝: {e}")
+                item["attempts"] = self.max_retries
+                failed.append(item)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"发送邮件失败: {e}")
+                failed.append(item)
+        self._last_used = time.monotonic()
+        return failed
+
+    async def _retry_later(self, item: Dict) -> None:
+        """按指数退避延迟后重新放入队列"""
+        await asyncio.sleep(self.retry_base_delay * (2 ** (item["attempts"] - 1)))
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.failed += 1
+            print(f"邮件队列已满，放弃发送: {item['message']['To']}")
+
+    async def _run(self) -> None:
+        """后台发送任务：攒批后复用连接发送"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # 长时间没有邮件，释放空闲连接
+                await loop.run_in_executor(self._executor, self._close)
+                continue
+
+            batch = [item]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                failed = await loop.run_in_executor(self._executor, self._send_batch, batch)
+            except Exception as e:
+                # 未预料的错误不能终止发送任务，整批按发送失败处理，稍后重试
+                self.errors += 1
+                print(f"发送邮件时出现未预料的错误: {e}")
+                failed = batch
+            self.sent += len(batch) - len(failed)
+
+            for item in failed:
+                item["attempts"] += 1
+                if item["attempts"] > self.max_retries:
+                    self.failed += 1
+                    print(f"邮件重试次数已用尽: {item['message']['To']}")
+                    continue
+                self.retried += 1
+                task = asyncio.create_task(self._retry_later(item))
+                self._retry_tasks.add(task)
+                task.add_done_callback(self._retry_tasks.discard)
+
+    def start(self) -> None:
+        """启动后台发送任务（未配置SMTP时不启动）"""
+        if self.enabled and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台发送任务并关闭SMTP连接"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._retry_tasks):
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+
+    def stats(self) -> Dict:
+        """获取邮件队列统计"""
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "errors": self.errors
+        }
+
+# 创建全局邮件队列实例
+mail_queue = MailQueue()
@@ -0,0 +1,132 @@
+"""
+消息清理模块
+清空聊天记录时只在会话上记录清空位置（读取时立即生效），由后台任务分小批物理删除被清空的消息
+每批在独立的短事务中删除，批次之间让出写锁，避免长时间阻塞其他写入；未完成的清理在服务启动时继续
+"""
+import asyncio
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from config import MESSAGE_PURGE_BATCH_SIZE, MESSAGE_PURGE_INTERVAL_SECONDS
+from models import async_engine
+
+# 删除会话中清空位置及之前的一批消息（消息ID由 AUTOINCREMENT 分配，不会重用被删除的ID）
+PURGE_CHUNK_SQL = (
+    "DELETE FROM messages WHERE id IN ("
+    "SELECT id FROM messages WHERE conversation_id = :conversation_id "
+    "AND id <= :cleared LIMIT :limit)"
+)
+
+# 仍有被清空的消息未删除的会话
+UNFINISHED_SQL = (
+    "SELECT id, cleared_before_message_id FROM conversations "
+    "WHERE cleared_before_message_id IS NOT NULL AND EXISTS ("
+    "SELECT 1 FROM messages WHERE messages.conversation_id = conversations.id "
+    "AND messages.id <= conversations.cleared_before_message_id)"
+)
+
+class MessagePurger:
+    """被清空消息的后台分批删除任务"""
+
+    def __init__(
+        self,
+        batch_size: int = MESSAGE_PURGE_BATCH_SIZE,
+        interval: float = MESSAGE_PURGE_INTERVAL_SECONDS
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        # 待清理的会话: 会话ID -> 清空位置
+        self._pending: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.batches = 0
+        self.purged = 0
+        self.completed = 0
+        self.failed = 0
+
+    def schedule(self, conversation_id: int, cleared_before_message_id: int) -> None:
+        """
+        登记需要清理的会话，立即返回
+        :param conversation_id: 会话ID
+        :param cleared_before_message_id: 清空位置（ID不超过该值的消息将被删除）
+        """
+        current = self._pending.get(conversation_id, 0)
+        self._pending[conversation_id] = max(current, cleared_before_message_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _purge_chunk(self, conversation_id: int, cleared: int) -> int:
+        """在一个短事务中删除一批消息，返回删除的条数"""
+        async with async_engine.begin() as conn:
+            result = await conn.execute(
+                text(PURGE_CHUNK_SQL),
+                {"conversation_id": conversation_id, "cleared": cleared, "limit": self.batch_size}
+            )
+            return result.rowcount
+
+    async def _run(self) -> None:
+        """后台任务：轮流为每个待清理的会话删除一批消息，批次之间暂停"""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # 取出最早登记的会话，未完成时放回末尾，多个会话轮流清理
+            conversation_id = next(iter(self._pending))
+            cleared = self._pending.pop(conversation_id)
+            try:
+                deleted = await self._purge_chunk(conversation_id, cleared)
+            except asyncio.CancelledError:
+                self.schedule(conversation_id, cleared)
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"清理会话 {conversation_id} 的消息失败: {e}")
+                self.schedule(conversation_id, cleared)
+                await asyncio.sleep(max(self.interval, 1))
+                continue
+
+            self.batches += 1
+            self.purged += deleted
+            if deleted >= self.batch_size:
+                self.schedule(conversation_id, cleared)
+            elif conversation_id not in self._pending:
+                self.completed += 1
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        """找出上次未完成的清理并启动后台任务"""
+        if self._task is None:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(text(UNFINISHED_SQL))
+                for conversation_id, cleared in result.all():
+                    self.schedule(conversation_id, cleared)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务，未完成的清理在下次启动时继续"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        """获取消息清理统计"""
+        return {
+            "pending_conversations": len(self._pending),
+            "batch_size": self.batch_size,
+            "interval": self.interval,
+            "batches": self.batches,
+            "purged": self.purged,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+# 创建全局消息清理任务实例
+message_purge = MessagePurger()
@@ -0,0 +1,187 @@
+"""
+消息搜索模块
+使用 SQLite FTS5 trigram 全文索引搜索聊天记录（外部内容表，不重复存储消息内容），由触发器与 messages 表保持同步
+trigram 按字符切分，中文等没有空格分词的文本同样可以按子串搜索
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, desc, func, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Conversation, Message, User
+from .user_search import MIN_FTS_QUERY_LENGTH, _escape_like
+
+# 摘要中标记命中关键词的标签
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# 摘要的最大长度（FTS5 按词元计，trigram 下约等于字符数）
+SNIPPET_TOKENS = 32
+
+# 全文索引表和同步触发器（rowid 即消息ID）
+MESSAGE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_search "
+    "USING fts5(content, content='messages', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS message_search_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO message_search(rowid, content) VALUES (new.id, new.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS message_search_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO message_search(message_search, rowid, content) VALUES ('delete', old.id, old.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS message_search_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO message_search(message_search, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO message_search(rowid, content) VALUES (new.id, new.content); "
+    "END",
+]
+
+async def create_message_search_index(conn) -> None:
+    """
+    创建全文索引和同步触发器，并从现有消息构建索引（数据库迁移中调用）
+    SQLite 不支持 FTS5 trigram 时跳过，消息搜索退化为 LIKE
+    :param conn: 异步数据库连接
+    """
+    result = await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_search'")
+    )
+    exists = result.first() is not None
+    try:
+        for statement in MESSAGE_SEARCH_DDL:
+            await conn.execute(text(statement))
+    except OperationalError as e:
+        print(f"当前SQLite不支持FTS5 trigram，跳过创建消息全文索引: {e}")
+        return
+
+    if not exists:
+        await conn.execute(text("INSERT INTO message_search(message_search) VALUES ('rebuild')"))
+
+def _highlight(content: str, query: str, size: int = SNIPPET_TOKENS) -> str:
+    """在 Python 中生成与 FTS5 snippet() 格式一致的摘要（用于不走全文索引的查询）"""
+    index = content.lower().find(query.lower())
+    if index < 0:
+        return content[:size]
+    start = max(0, index - (size - len(query)) // 2)
+    end = min(len(content), start + max(size, len(query)))
+    return (
+        ("…" if start > 0 else "")
+        + content[start:index]
+        + HIGHLIGHT_START + content[index:index + len(query)] + HIGHLIGHT_END
+        + content[index + len(query):end]
+        + ("…" if end < len(content) else "")
+    )
+
+class MessageSearchIndex:
+    """消息搜索索引"""
+
+    def __init__(self):
+        # 当前SQLite是否支持 FTS5 trigram 分词器
+        self.available = False
+
+    async def check(self, conn) -> None:
+        """
+        检查全文索引是否可用（启动时调用）
+        :param conn: 异步数据库连接
+        """
+        result = await conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_search'")
+        )
+        self.available = result.first() is not None
+        if not self.available:
+            print("消息全文索引不可用，消息搜索将使用LIKE")
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        conversation_id: Optional[int],
+        limit: int,
+        offset: int = 0
+    ) -> List[Tuple[Message, User, str]]:
+        """
+        在用户参与的会话中搜索消息（不包含已清空的消息），结果按相关度排序
+        :param db: 数据库会话
+        :param user_id: 当前用户ID（只搜索该用户参与的会话）
+        :param query: 搜索关键词
+        :param conversation_id: 会话ID，为空时搜索全部会话
+        :param limit: 返回数量
+        :param offset: 跳过的结果数
+        :return: (消息, 发送者, 高亮摘要) 列表
+        """
+        if len(query) < MIN_FTS_QUERY_LENGTH or not self.available:
+            return await self._search_like(db, user_id, query, conversation_id, limit, offset)
+
+        # 整体作为一个短语查询，trigram 分词下即子串匹配
+        match = '"' + query.replace('"', '""') + '"'
+        sql = (
+            "SELECT message_search.rowid, "
+            f"snippet(message_search, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', {SNIPPET_TOKENS}) "
+            "FROM message_search JOIN messages ON messages.id = message_search.rowid "
+            "JOIN conversations ON conversations.id = messages.conversation_id "
+            "WHERE message_search MATCH :match "
+            "AND (conversations.user1_id = :user_id OR conversations.user2_id = :user_id) "
+            "AND messages.id > COALESCE(conversations.cleared_before_message_id, 0) "
+        )
+        params = {"match": match, "user_id": user_id, "limit": limit, "offset": offset}
+        if conversation_id is not None:
+            sql += "AND messages.conversation_id = :conversation_id "
+            params["conversation_id"] = conversation_id
+        sql += "ORDER BY bm25(message_search), message_search.rowid DESC LIMIT :limit OFFSET :offset"
+        result = await db.execute(text(sql), params)
+        snippets = {message_id: snippet for message_id, snippet in result.all()}
+        if not snippets:
+            return []
+
+        result = await db.execute(
+            select(Message, User)
+            .join(User, Message.sender_id == User.id)
+            .where(Message.id.in_(list(snippets)))
+        )
+        rows = {message.id: (message, sender) for message, sender in result.all()}
+        return [
+            (*rows[message_id], snippet)
+            for message_id, snippet in snippets.items()
+            if message_id in rows
+        ]
+
+    async def _search_like(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        conversation_id: Optional[int],
+        limit: int,
+        offset: int
+    ) -> List[Tuple[Message, User, str]]:
+        """
+        短关键词或不支持全文索引时的回退方案，按时间倒序返回
+        先按会话缩小范围，再在 (conversation_id, created_at) 索引上逐个会话扫描
+        """
+        statement = (
+            select(Message, User)
+            .join(User, Message.sender_id == User.id)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(
+                and_(
+                    or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id),
+                    # 排除已清空、等待后台删除的消息
+                    Message.id > func.coalesce(Conversation.cleared_before_message_id, 0),
+                    Message.content.ilike(f"%{_escape_like(query)}%", escape="\\")
+                )
+            )
+        )
+        if conversation_id is not None:
+            statement = statement.where(Message.conversation_id == conversation_id)
+        result = await db.execute(
+            statement
+            .order_by(desc(Message.created_at), desc(Message.id))
+            .limit(limit)
+            .offset(offset)
+        )
+        return [
+            (message, sender, _highlight(message.content or "", query))
+            for message, sender in result.all()
+        ]
+
+# 创建全局消息搜索索引实例
+message_search = MessageSearchIndex()
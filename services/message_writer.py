@@ -0,0 +1,275 @@
+"""
+消息写入模块
+批量模式下，发送消息的请求完成校验后放入队列，由单个写入任务按批在一个事务中提交（组提交）
+SQLite 的每次提交都需要独占写锁并落盘，合并提交可以显著提高发送吞吐；每个请求在所在批次提交后得到消息ID和时间
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, insert, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from config import (
+    MESSAGE_WRITE_MODE,
+    MESSAGE_WRITE_BATCH_SIZE,
+    MESSAGE_WRITE_MAX_DELAY_SECONDS,
+    MESSAGE_WRITE_MAX_PENDING,
+    MESSAGE_WRITE_MAX_RETRIES,
+    MESSAGE_WRITE_RETRY_BASE_DELAY_SECONDS,
+)
+from models import Conversation, Message, async_engine
+
+class MessageWriterBusy(Exception):
+    """消息写入队列已满"""
+    pass
+
+def _is_transient(error: Exception) -> bool:
+    """数据库忙或被锁等稍后重试即可成功的错误"""
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+class MessageWriter:
+    """消息组提交写入器"""
+
+    def __init__(
+        self,
+        mode: str = MESSAGE_WRITE_MODE,
+        batch_size: int = MESSAGE_WRITE_BATCH_SIZE,
+        max_delay: float = MESSAGE_WRITE_MAX_DELAY_SECONDS,
+        max_pending: int = MESSAGE_WRITE_MAX_PENDING,
+        max_retries: int = MESSAGE_WRITE_MAX_RETRIES,
+        retry_base_delay: float = MESSAGE_WRITE_RETRY_BASE_DELAY_SECONDS
+    ):
+        if mode not in ("direct", "batch"):
+            raise ValueError(f"不支持的消息写入模式: {mode}")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.split = 0
+        self.max_batch = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用了批量写入（写入任务运行中）"""
+        return self._task is not None
+
+    async def submit(self, sender_id: int, receiver_id: int, content: str) -> Dict:
+        """
+        提交一条已通过校验的消息，等待所在批次提交
+        :param sender_id: 发送者ID
+        :param receiver_id: 接收者ID
+        :param content: 消息内容
+        :return: {"conversation_id", "message_id", "created_at"}
+        :raises: MessageWriterBusy 如果等待写入的消息过多
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((sender_id, receiver_id, content, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise MessageWriterBusy("消息写入队列已满")
+        return await future
+
+    async def _collect(self, first) -> List:
+        """从第一条消息开始攒批，直到达到批大小或最大等待时间"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                # 停止信号，放回队列由写入循环处理
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def _write_batch(self, batch: List) -> List[Dict]:
+        """
+        在一个事务中写入一批消息，并更新相关会话的摘要
+        :return: 与 batch 顺序一致的写入结果
+        """
+        now = datetime.now(timezone.utc)
+        pairs = {(sender_id, receiver_id) for sender_id, receiver_id, _, _ in batch}
+        async with async_engine.begin() as conn:
+            # 一次查询找出本批涉及的所有会话（两个方向）
+            result = await conn.execute(
+                select(Conversation.id, Conversation.user1_id, Conversation.user2_id).where(
+                    or_(*[
+                        or_(
+                            and_(Conversation.user1_id == a, Conversation.user2_id == b),
+                            and_(Conversation.user1_id == b, Conversation.user2_id == a)
+                        )
+                        for a, b in pairs
+                    ])
+                )
+            )
+            conversations: Dict[Tuple[int, int], Tuple[int, int]] = {}
+            for conversation_id, user1_id, user2_id in result:
+                for key in ((user1_id, user2_id), (user2_id, user1_id)):
+                    conversations.setdefault(key, (conversation_id, user1_id))
+
+            # 创建缺少的会话（与直接写入模式一致，发起者为 user1）
+            for sender_id, receiver_id, _, _ in batch:
+                if (sender_id, receiver_id) not in conversations:
+                    result = await conn.execute(
+                        insert(Conversation)
+                        .values(user1_id=sender_id, user2_id=receiver_id, created_at=now, last_message_at=now)
+                        .returning(Conversation.id)
+                    )
+                    conversation = (result.scalar_one(), sender_id)
+                    conversations[(sender_id, receiver_id)] = conversation
+                    conversations[(receiver_id, sender_id)] = conversation
+
+            # 批量插入消息，按参数顺序返回ID
+            result = await conn.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "conversation_id": conversations[(sender_id, receiver_id)][0],
+                        "sender_id": sender_id,
+                        "content": content,
+                        "created_at": now,
+                        "is_read": False
+                    }
+                    for sender_id, receiver_id, content, _ in batch
+                ]
+            )
+            message_ids = list(result.scalars())
+
+            # 每个会话只更新一次: 最后一条消息和双方新增的未读数
+            summaries: Dict[int, Dict] = {}
+            for (sender_id, receiver_id, _, _), message_id in zip(batch, message_ids):
+                conversation_id, user1_id = conversations[(sender_id, receiver_id)]
+                summary = summaries.setdefault(
+                    conversation_id, {"b_id": conversation_id, "b_last": message_id, "b_unread1": 0, "b_unread2": 0}
+                )
+                summary["b_last"] = max(summary["b_last"], message_id)
+                summary["b_unread1" if receiver_id == user1_id else "b_unread2"] += 1
+            await conn.execute(
+                update(Conversation.__table__)
+                .where(Conversation.__table__.c.id == bindparam("b_id"))
+                .values(
+                    last_message_id=bindparam("b_last"),
+                    last_message_at=now,
+                    user1_unread_count=Conversation.__table__.c.user1_unread_count + bindparam("b_unread1"),
+                    user2_unread_count=Conversation.__table__.c.user2_unread_count + bindparam("b_unread2")
+                ),
+                list(summaries.values())
+            )
+
+        # 与直接写入模式从数据库读回的时间格式一致（不带时区）
+        created_at = now.replace(tzinfo=None)
+        return [
+            {
+                "conversation_id": conversations[(sender_id, receiver_id)][0],
+                "message_id": message_id,
+                "created_at": created_at
+            }
+            for (sender_id, receiver_id, _, _), message_id in zip(batch, message_ids)
+        ]
+
+    async def _write_with_retry(self, batch: List) -> List[Dict]:
+        """写入一批消息，数据库忙或被锁时按指数退避重试"""
+        attempt = 0
+        while True:
+            try:
+                return await self._write_batch(batch)
+            except Exception as e:
+                if not _is_transient(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(self.retry_base_delay * (2 ** (attempt - 1)))
+
+    async def _commit(self, batch: List) -> None:
+        """
+        写入一批消息并唤醒等待的请求
+        整批失败时（事务已回滚）改为逐条写入，只有出错的消息返回失败，不影响同批的其他发送者
+        """
+        try:
+            results = await self._write_with_retry(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                self.split += 1
+                print(f"批量写入消息失败，改为逐条写入: {e}")
+                for item in batch:
+                    await self._commit([item])
+                return
+            self.failed += 1
+            print(f"写入消息失败: {e}")
+            future = batch[0][3]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self) -> None:
+        """写入任务：攒批、提交，并唤醒等待的请求"""
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = await self._collect(item)
+            await self._commit(batch)
+
+    def start(self) -> None:
+        """启动写入任务（仅批量模式）"""
+        if self.mode == "batch" and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """写入队列中剩余的消息后停止写入任务"""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict:
+        """获取消息写入统计"""
+        return {
+            "mode": self.mode,
+            "batch_size": self.batch_size,
+            "max_delay": self.max_delay,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "split_batches": self.split,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0,
+            "max_batch": self.max_batch
+        }
+
+# 创建全局消息写入器实例
+message_writer = MessageWriter()
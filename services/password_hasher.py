@@ -0,0 +1,145 @@
+"""
+密码哈希模块
+在独立的线程池或进程池中执行bcrypt哈希和校验，避免阻塞事件循环
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from passlib.context import CryptContext
+
+from config import (
+    PASSWORD_HASHER_KIND,
+    PASSWORD_HASHER_WORKERS,
+    PASSWORD_HASHER_MAX_PENDING,
+)
+
+# 密码加密上下文（模块级，进程池的子进程中同样可用）
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _hash_password(password: str) -> str:
+    """在工作线程/进程中计算密码哈希"""
+    return pwd_context.hash(password)
+
+def _hash_passwords(passwords: List[str]) -> List[str]:
+    """在工作线程/进程中批量计算密码哈希"""
+    return [pwd_context.hash(password) for password in passwords]
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    """在工作线程/进程中校验密码"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+class PasswordHasherBusy(Exception):
+    """密码哈希队列已满"""
+    pass
+
+class PasswordHasher:
+    """带有界等待队列的密码哈希执行器"""
+
+    def __init__(
+        self,
+        kind: str = PASSWORD_HASHER_KIND,
+        max_workers: int = PASSWORD_HASHER_WORKERS,
+        max_pending: int = PASSWORD_HASHER_MAX_PENDING
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"不支持的执行器类型: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        # 已提交但尚未完成的任务数（包括正在执行的）
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        """按需创建执行器"""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    async def _submit(self, func, *args):
+        """
+        提交任务到执行器，队列已满时立即拒绝
+        :raises: PasswordHasherBusy 如果等待中的任务数已达上限
+        """
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy("密码哈希队列已满")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        """
+        计算密码哈希
+        :param password: 明文密码
+        :return: 哈希后的密码
+        """
+        return await self._submit(_hash_password, password)
+
+    async def hash_many(self, passwords: List[str], slice_size: int = 4) -> List[str]:
+        """
+        批量计算密码哈希，切成小片后在所有工作线程/进程上并行执行
+        同时在执行的切片数不超过工作数，登录等单次请求最多等待一个切片的时间
+        :param passwords: 明文密码列表
+        :param slice_size: 每个任务处理的密码数
+        :return: 与输入顺序一致的哈希列表
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run_slice(chunk: List[str]) -> List[str]:
+            async with semaphore:
+                while True:
+                    try:
+                        return await self._submit(_hash_passwords, chunk)
+                    except PasswordHasherBusy:
+                        # 队列已满时让出给在线请求，稍后重试
+                        await asyncio.sleep(0.1)
+
+        results = await asyncio.gather(*(
+            run_slice(passwords[i:i + slice_size])
+            for i in range(0, len(passwords), slice_size)
+        ))
+        return [hashed for chunk in results for hashed in chunk]
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        校验密码
+        :param plain_password: 明文密码
+        :param hashed_password: 数据库中存储的哈希密码
+        :return: 密码是否匹配
+        """
+        return await self._submit(_verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        """关闭执行器（应用关闭时调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        """获取执行器运行统计"""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+# 创建全局密码哈希执行器实例
+password_hasher = PasswordHasher()
@@ -0,0 +1,184 @@
+"""
+在线状态模块
+在内存中维护用户心跳，过期自动下线，并定期批量写回 users 表
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from config import PRESENCE_TTL_SECONDS, PRESENCE_FLUSH_INTERVAL_SECONDS
+from models import User, async_engine
+
+class PresenceManager:
+    """在线状态管理类"""
+
+    def __init__(
+        self,
+        ttl: int = PRESENCE_TTL_SECONDS,
+        flush_interval: int = PRESENCE_FLUSH_INTERVAL_SECONDS
+    ):
+        self.ttl = timedelta(seconds=ttl)
+        self.flush_interval = flush_interval
+        # 用户ID到最后心跳时间的映射（仅包含在线用户）
+        self._last_seen: Dict[int, datetime] = {}
+        # 等待写回数据库的状态变更: {user_id: (is_online, last_active)}
+        self._dirty: Dict[int, Tuple[bool, datetime]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def heartbeat(self, user_id: int) -> datetime:
+        """
+        记录用户心跳（同时将用户标记为在线）
+        :param user_id: 用户ID
+        :return: 本次心跳时间
+        """
+        now = datetime.now(timezone.utc)
+        self._last_seen[user_id] = now
+        self._dirty[user_id] = (True, now)
+        return now
+
+    def mark_offline(self, user_id: int) -> None:
+        """
+        将用户标记为离线（登出时调用）
+        :param user_id: 用户ID
+        """
+        self._last_seen.pop(user_id, None)
+        self._dirty[user_id] = (False, datetime.now(timezone.utc))
+
+    def get_status(self, user_id: int) -> Optional[Dict]:
+        """
+        从内存获取用户在线状态
+        :param user_id: 用户ID
+        :return: 在线状态，本进程没有该用户的记录时返回None
+        """
+        last_seen = self._last_seen.get(user_id)
+        if last_seen is not None:
+            return {
+                "is_online": last_seen > datetime.now(timezone.utc) - self.ttl,
+                "last_active": last_seen.isoformat()
+            }
+
+        dirty = self._dirty.get(user_id)
+        if dirty is not None:
+            return {"is_online": False, "last_active": dirty[1].isoformat()}
+        return None
+
+    def resolve(self, user: User) -> Dict:
+        """
+        获取用户在线状态，内存中没有记录时回退到数据库中的字段
+        超过心跳有效期的数据库在线标记视为离线
+        :param user: 用户对象
+        :return: 在线状态
+        """
+        status = self.get_status(user.id)
+        if status is not None:
+            return status
+
+        last_active = user.last_active
+        if last_active is not None and last_active.tzinfo is None:
+            last_active = last_active.replace(tzinfo=timezone.utc)
+        is_online = bool(user.is_online) and last_active is not None \
+            and last_active > datetime.now(timezone.utc) - self.ttl
+        return {
+            "is_online": is_online,
+            "last_active": last_active.isoformat() if last_active else None
+        }
+
+    def resolve_many(self, users: Iterable[User]) -> Dict[int, Dict]:
+        """
+        批量获取用户在线状态
+        :param users: 用户对象列表
+        :return: 用户ID到在线状态的映射
+        """
+        return {user.id: self.resolve(user) for user in users}
+
+    def expire(self) -> int:
+        """
+        将超过心跳有效期的用户标记为离线
+        :return: 本次下线的用户数
+        """
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        expired = [uid for uid, seen in self._last_seen.items() if seen <= cutoff]
+        for user_id in expired:
+            last_seen = self._last_seen.pop(user_id)
+            self._dirty[user_id] = (False, last_seen)
+        return len(expired)
+
+    async def flush(self) -> int:
+        """
+        将积累的在线状态变更批量写回数据库
+        同时清理其他进程遗留的过期在线标记
+        :return: 写回的用户数
+        """
+        self.expire()
+        dirty, self._dirty = self._dirty, {}
+
+        users = User.__table__
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        try:
+            async with async_engine.begin() as conn:
+                if dirty:
+                    await conn.execute(
+                        update(users)
+                        .where(users.c.id == bindparam("b_id"))
+                        .values(
+                            is_online=bindparam("b_is_online"),
+                            last_active=bindparam("b_last_active")
+                        ),
+                        [
+                            {"b_id": uid, "b_is_online": online, "b_last_active": ts}
+                            for uid, (online, ts) in dirty.items()
+                        ]
+                    )
+                await conn.execute(
+                    update(users)
+                    .where(
+                        and_(
+                            users.c.is_online == True,
+                            or_(users.c.last_active == None, users.c.last_active < cutoff)
+                        )
+                    )
+                    .values(is_online=False)
+                )
+        except Exception as e:
+            # 写回失败时保留变更，下次再试（期间产生的新状态优先）
+            for user_id, state in dirty.items():
+                self._dirty.setdefault(user_id, state)
+            print(f"在线状态写回失败: {e}")
+            return 0
+        return len(dirty)
+
+    async def _run(self) -> None:
+        """后台定期写回任务"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """启动后台写回任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台写回任务并写回剩余变更"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        """获取在线状态统计"""
+        return {
+            "online": len(self._last_seen),
+            "pending_writes": len(self._dirty),
+            "ttl": int(self.ttl.total_seconds()),
+            "flush_interval": self.flush_interval
+        }
+
+# 创建全局在线状态管理器实例
+presence_manager = PresenceManager()
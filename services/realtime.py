@@ -0,0 +1,231 @@
+"""
+实时推送模块
+维护本进程内的 WebSocket 连接，按用户ID推送事件
+每个连接有独立的有界发送队列和发送任务，慢速客户端不会阻塞发布方和其他连接
+令牌只在握手时校验，连接在令牌过期或用户登出时由服务端关闭
+"""
+import asyncio
+import json
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from config import REALTIME_QUEUE_SIZE, REALTIME_SEND_TIMEOUT_SECONDS
+
+# 发送队列溢出或发送超时时使用的关闭码（1013: Try Again Later），客户端应重连并通过接口补齐数据
+CLOSE_SLOW_CONSUMER = 1013
+# 令牌过期或用户登出时使用的关闭码（1008: Policy Violation），客户端应重新登录后再连接
+CLOSE_POLICY_VIOLATION = 1008
+
+class Connection:
+    """单个 WebSocket 连接"""
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int, expires_at: Optional[float] = None):
+        self.websocket = websocket
+        self.user_id = user_id
+        # 令牌的过期时间（UNIX 时间戳），为空时不过期
+        self.expires_at = expires_at
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+        # 服务端主动关闭时使用的关闭码和原因
+        self.close_code = CLOSE_SLOW_CONSUMER
+        self.close_reason = "slow consumer"
+
+class ConnectionHub:
+    """WebSocket 连接注册表和发布订阅中心"""
+
+    def __init__(
+        self,
+        queue_size: int = REALTIME_QUEUE_SIZE,
+        send_timeout: float = REALTIME_SEND_TIMEOUT_SECONDS
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # 用户ID -> 该用户的所有连接（多设备）
+        self._connections: Dict[int, Set[Connection]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.revoked = 0
+
+    def connect(self, websocket: WebSocket, user_id: int, expires_at: Optional[float] = None) -> Connection:
+        """
+        注册已接受的连接并启动其发送任务
+        :param websocket: 已 accept 的 WebSocket
+        :param user_id: 用户ID
+        :param expires_at: 令牌的过期时间，到期后关闭连接
+        :return: 连接对象
+        """
+        connection = Connection(websocket, user_id, self.queue_size, expires_at)
+        self._connections.setdefault(user_id, set()).add(connection)
+        connection.task = asyncio.create_task(self._sender(connection))
+        return connection
+
+    async def disconnect(self, connection: Connection) -> None:
+        """
+        注销连接并停止其发送任务
+        :param connection: 连接对象
+        """
+        self._unregister(connection)
+        task = connection.task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _unregister(self, connection: Connection) -> None:
+        """从注册表中移除连接"""
+        connections = self._connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._connections[connection.user_id]
+
+    def is_connected(self, user_id: int) -> bool:
+        """用户在本进程中是否有活动连接"""
+        return user_id in self._connections
+
+    def publish(self, user_ids: Iterable[int], event: Dict) -> int:
+        """
+        向指定用户的所有连接推送事件，立即返回
+        事件只序列化一次；某个连接的队列已满时断开该连接，不影响其他连接
+        :param user_ids: 接收事件的用户ID
+        :param event: 事件内容（可JSON序列化）
+        :return: 放入发送队列的连接数
+        """
+        self.published += 1
+        payload = None
+        queued = 0
+        for user_id in set(user_ids):
+            for connection in list(self._connections.get(user_id, ())):
+                if connection.closing:
+                    continue
+                if payload is None:
+                    payload = json.dumps(event, ensure_ascii=False, default=str)
+                try:
+                    connection.queue.put_nowait(payload)
+                    queued += 1
+                except asyncio.QueueFull:
+                    self._drop(connection, "发送队列已满")
+        return queued
+
+    def send(self, connection: Connection, event: Dict) -> bool:
+        """
+        向单个连接发送事件（如心跳回复）
+        :param connection: 连接对象
+        :param event: 事件内容
+        :return: 是否放入发送队列
+        """
+        if connection.closing:
+            return False
+        try:
+            connection.queue.put_nowait(json.dumps(event, ensure_ascii=False, default=str))
+            return True
+        except asyncio.QueueFull:
+            self._drop(connection, "发送队列已满")
+            return False
+
+    def close_user(self, user_id: int, reason: str = "logged out") -> int:
+        """
+        关闭用户在本进程中的所有连接（用户登出后调用）
+        :param user_id: 用户ID
+        :param reason: 关闭原因
+        :return: 关闭的连接数
+        """
+        closed = 0
+        for connection in list(self._connections.get(user_id, ())):
+            if self._close(connection, CLOSE_POLICY_VIOLATION, reason):
+                closed += 1
+        self.revoked += closed
+        return closed
+
+    def _drop(self, connection: Connection, reason: str) -> None:
+        """断开跟不上推送速度的连接"""
+        if self._close(connection, CLOSE_SLOW_CONSUMER, "slow consumer"):
+            self.dropped += 1
+            print(f"断开慢速连接(用户{connection.user_id}): {reason}")
+
+    def _close(self, connection: Connection, code: int, reason: str) -> bool:
+        """
+        注销连接并停止其发送任务，由发送任务以指定的关闭码关闭连接
+        :return: 是否是首次关闭
+        """
+        if connection.closing:
+            return False
+        connection.closing = True
+        connection.close_code = code
+        connection.close_reason = reason
+        self._unregister(connection)
+        if connection.task is not None and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+        return True
+
+    async def _sender(self, connection: Connection) -> None:
+        """
+        连接的发送任务：按顺序发送队列中的事件，单次发送超时视为慢速客户端
+        令牌到期时即使没有待发送的事件也会关闭连接
+        """
+        websocket = connection.websocket
+        try:
+            while True:
+                timeout = None
+                if connection.expires_at is not None:
+                    timeout = connection.expires_at - time.time()
+                    if timeout <= 0:
+                        if self._close(connection, CLOSE_POLICY_VIOLATION, "token expired"):
+                            self.revoked += 1
+                        break
+                try:
+                    payload = await asyncio.wait_for(connection.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    continue
+                try:
+                    await asyncio.wait_for(websocket.send_text(payload), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    self._drop(connection, "发送超时")
+                    break
+                self.delivered += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # 连接已断开，由接收循环负责注销
+            return
+        if connection.closing and websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await asyncio.wait_for(
+                    websocket.close(code=connection.close_code, reason=connection.close_reason),
+                    timeout=self.send_timeout
+                )
+            except Exception:
+                pass
+
+    async def close_all(self) -> None:
+        """关闭所有连接（服务关闭时调用）"""
+        for connections in list(self._connections.values()):
+            for connection in list(connections):
+                connection.closing = True
+                await self.disconnect(connection)
+                try:
+                    await connection.websocket.close(code=1001)
+                except Exception:
+                    pass
+
+    def stats(self) -> Dict:
+        """获取推送统计"""
+        return {
+            "users": len(self._connections),
+            "connections": sum(len(connections) for connections in self._connections.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_connections": self.dropped,
+            "revoked_connections": self.revoked,
+            "queue_size": self.queue_size
+        }
+
+# 创建全局连接中心实例
+connection_hub = ConnectionHub()
@@ -0,0 +1,138 @@
+"""
+令牌-用户缓存模块
+缓存已验证令牌对应的用户快照，避免每个认证请求都查询数据库
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS
+from models import User
+
+class UserCache:
+    """带容量上限和过期时间的令牌-用户快照缓存（LRU淘汰）"""
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl: int = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        # 令牌到 (过期时间, 用户字段快照) 的映射，按最近使用排序
+        self._entries: "OrderedDict[str, tuple[float, Dict]]" = OrderedDict()
+        # 用户ID到其已缓存令牌集合的映射，用于按用户失效
+        self._user_tokens: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Dict]:
+        """
+        获取令牌对应的用户快照
+        :param token: JWT令牌
+        :return: 用户字段快照，未命中或已过期时返回None
+        """
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return snapshot
+
+    def put(self, token: str, user: User, token_exp: Optional[float] = None) -> None:
+        """
+        缓存令牌对应的用户快照
+        :param token: JWT令牌
+        :param user: 已从数据库加载的用户对象
+        :param token_exp: 令牌过期的Unix时间戳，缓存条目不会比令牌活得更久
+        """
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        snapshot = {
+            column.key: getattr(user, column.key)
+            for column in inspect(User).column_attrs
+        }
+
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (time.monotonic() + ttl, snapshot)
+        self._user_tokens.setdefault(user.id, set()).add(token)
+
+        # 超出容量时淘汰最久未使用的条目
+        while len(self._entries) > self.max_size:
+            oldest_token = next(iter(self._entries))
+            self._remove(oldest_token)
+            self.evictions += 1
+
+    async def attach(self, snapshot: Dict, db: AsyncSession) -> User:
+        """
+        将用户快照还原为绑定到当前数据库会话的用户对象（不产生查询）
+        路由对返回对象的修改仍会在提交时正常写回数据库
+        :param snapshot: 用户字段快照
+        :param db: 数据库会话
+        :return: 用户对象
+        """
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    def invalidate_token(self, token: str) -> None:
+        """
+        使单个令牌的缓存失效（登出时调用）
+        :param token: JWT令牌
+        """
+        self._remove(token)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        使某个用户所有令牌的缓存失效（资料更新、令牌轮换时调用）
+        :param user_id: 用户ID
+        """
+        for token in list(self._user_tokens.get(user_id, ())):
+            self._remove(token)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._user_tokens.clear()
+
+    def stats(self) -> Dict:
+        """获取缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def _remove(self, token: str) -> None:
+        """移除令牌条目并维护用户索引"""
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].get("id")
+        tokens = self._user_tokens.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._user_tokens[user_id]
+
+# 创建全局令牌-用户缓存实例
+user_cache = UserCache()
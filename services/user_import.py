@@ -0,0 +1,276 @@
+"""
+批量导入用户模块
+流式读取 CSV/JSONL 文件，分块去重、并行哈希密码并批量写入数据库
+命令行用法: python -m services.user_import users.csv [--format jsonl] [--chunk-size 1000]
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from config import USER_IMPORT_CHUNK_SIZE
+from models import User, async_engine, normalize_email
+from services.password_hasher import password_hasher
+
+# 每一行解析结果: (行号, 用户数据, 错误信息)
+ParsedRow = Tuple[int, Optional[Dict], Optional[str]]
+
+def detect_format(filename: Optional[str]) -> str:
+    """
+    根据文件名判断导入格式
+    :param filename: 文件名
+    :return: csv 或 jsonl
+    """
+    if filename and filename.lower().endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    将字节流按行切分（保留换行符），只缓存当前未结束的一行
+    :param chunks: 字节块迭代器（如请求体流）
+    :return: 文本行迭代器
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.splitlines(keepends=True)
+        buffer = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+async def parse_rows(lines: AsyncIterable[str], fmt: str) -> AsyncIterator[ParsedRow]:
+    """
+    逐行解析导入文件，不会一次性读入整个文件
+    :param lines: 文本行迭代器
+    :param fmt: csv 或 jsonl
+    :return: 解析结果迭代器
+    """
+    if fmt == "csv":
+        header: Optional[List[str]] = None
+        record_text = ""
+        record_line = 0
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if not record_text:
+                record_line = line_no
+            record_text += line
+            # 引号未闭合说明字段中包含换行，继续读取下一行
+            if record_text.count('"') % 2:
+                continue
+            values = next(csv.reader([record_text]), [])
+            record_text = ""
+            if not values:
+                continue
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield record_line, dict(zip(header, values)), None
+        if record_text:
+            yield record_line, None, "CSV格式错误: 引号未闭合"
+    elif fmt == "jsonl":
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"JSON格式错误: {e.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "每行必须是一个JSON对象"
+                continue
+            yield line_no, record, None
+    else:
+        raise ValueError(f"不支持的导入格式: {fmt}")
+
+class UserImporter:
+    """批量用户导入器"""
+
+    def __init__(self, chunk_size: int = USER_IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+
+    async def run(self, rows: AsyncIterable[ParsedRow]) -> AsyncIterator[Dict]:
+        """
+        执行导入，每处理完一块产出一次进度（包含该块的逐行错误）
+        :param rows: parse_rows 的解析结果
+        :return: 进度事件迭代器，最后一个事件的 type 为 done
+        """
+        chunk: List[ParsedRow] = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield await self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield await self._import_chunk(chunk)
+
+        yield {
+            "type": "done",
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.failed
+        }
+
+    async def _import_chunk(self, chunk: List[ParsedRow]) -> Dict:
+        """导入一块数据：校验、去重、哈希、批量写入"""
+        errors: List[Dict] = []
+        candidates: List[Tuple[int, str, str, str, str]] = []
+        seen_usernames = set()
+        seen_emails = set()
+
+        # 校验字段并在块内去重
+        for line_no, record, error in chunk:
+            if error:
+                errors.append({"line": line_no, "error": error})
+                continue
+            username = str(record.get("username") or "").strip()
+            email = str(record.get("email") or "").strip()
+            password = str(record.get("password") or "")
+            if not username or not email or not password:
+                errors.append({"line": line_no, "error": "username、email、password 均不能为空"})
+                continue
+            normalized = normalize_email(email)
+            if username in seen_usernames:
+                errors.append({"line": line_no, "error": "用户名在文件中重复"})
+                continue
+            if normalized in seen_emails:
+                errors.append({"line": line_no, "error": "邮箱在文件中重复"})
+                continue
+            seen_usernames.add(username)
+            seen_emails.add(normalized)
+            candidates.append((line_no, username, email, normalized, password))
+
+        # 批量查询与已有用户的冲突
+        if candidates:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(
+                    select(User.username).where(User.username.in_(seen_usernames))
+                )
+                existing_usernames = set(result.scalars())
+                result = await conn.execute(
+                    select(User.email_normalized).where(User.email_normalized.in_(seen_emails))
+                )
+                existing_emails = set(result.scalars())
+
+            remaining = []
+            for candidate in candidates:
+                line_no, username, _, normalized, _ = candidate
+                if username in existing_usernames:
+                    errors.append({"line": line_no, "error": "用户名已存在"})
+                elif normalized in existing_emails:
+                    errors.append({"line": line_no, "error": "邮箱已注册"})
+                else:
+                    remaining.append(candidate)
+            candidates = remaining
+
+        created = 0
+        if candidates:
+            hashed_passwords = await password_hasher.hash_many([c[4] for c in candidates])
+            now = datetime.now(timezone.utc)
+            values = [
+                {
+                    "line": line_no,
+                    "username": username,
+                    "email": email,
+                    "email_normalized": normalized,
+                    "hashed_password": hashed,
+                    "is_active": True,
+                    "is_online": False,
+                    "create_at": now
+                }
+                for (line_no, username, email, normalized, _), hashed
+                in zip(candidates, hashed_passwords)
+            ]
+            created = await self._insert(values, errors)
+
+        self.processed += len(chunk)
+        self.created += created
+        self.failed += len(errors)
+        return {
+            "type": "progress",
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": sorted(errors, key=lambda e: e["line"])
+        }
+
+    async def _insert(self, values: List[Dict], errors: List[Dict]) -> int:
+        """
+        在一个事务内批量插入（executemany），与并发注册冲突时退化为逐行插入
+        :return: 成功插入的行数
+        """
+        rows = [{k: v for k, v in value.items() if k != "line"} for value in values]
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(insert(User.__table__), rows)
+            return len(rows)
+        except IntegrityError:
+            pass
+
+        created = 0
+        async with async_engine.begin() as conn:
+            for value, row in zip(values, rows):
+                try:
+                    async with conn.begin_nested():
+                        await conn.execute(insert(User.__table__), row)
+                    created += 1
+                except IntegrityError:
+                    errors.append({"line": value["line"], "error": "用户名或邮箱已存在"})
+        return created
+
+async def read_blocks(f: BinaryIO, block_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    按块读取二进制文件
+    :param f: 已打开的二进制文件对象
+    :param block_size: 每块字节数
+    :return: 字节块迭代器
+    """
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        yield block
+        # 每读一块让出一次事件循环
+        await asyncio.sleep(0)
+
+async def _main(path: str, fmt: Optional[str], chunk_size: int) -> None:
+    """命令行入口：导入文件并打印进度"""
+    importer = UserImporter(chunk_size=chunk_size)
+    try:
+        with open(path, "rb") as f:
+            rows = parse_rows(iter_lines(read_blocks(f)), fmt or detect_format(path))
+            async for event in importer.run(rows):
+                if event["type"] == "progress":
+                    for error in event["errors"]:
+                        print(f"第 {error['line']} 行: {error['error']}")
+                    print(f"已处理 {event['processed']} 行，成功 {event['created']}，失败 {event['failed']}")
+                else:
+                    print(f"导入完成: 共 {event['processed']} 行，成功 {event['created']}，失败 {event['failed']}")
+    finally:
+        password_hasher.shutdown()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量导入用户")
+    parser.add_argument("path", help="CSV（表头: username,email,password）或 JSONL 文件路径")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="文件格式，默认根据扩展名判断")
+    parser.add_argument("--chunk-size", type=int, default=USER_IMPORT_CHUNK_SIZE, help="每个事务写入的行数")
+    args = parser.parse_args()
+    asyncio.run(_main(args.path, args.format, args.chunk_size))
@@ -0,0 +1,183 @@
+"""
+用户搜索模块
+使用 SQLite FTS5 trigram 全文索引搜索用户名、邮箱和个人简介，由触发器与 users、user_profiles 表保持同步
+"""
+from typing import List, Tuple
+
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import User, UserProfile
+
+# trigram 分词器按3个字符切分，更短的查询无法命中全文索引
+MIN_FTS_QUERY_LENGTH = 3
+
+# 全文索引表和同步触发器（rowid 即用户ID）
+USER_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search "
+    "USING fts5(username, email, bio, tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS user_search_users_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO user_search(rowid, username, email, bio) VALUES ("
+    "new.id, new.username, new.email, "
+    "(SELECT bio FROM user_profiles WHERE user_id = new.id)); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_users_au AFTER UPDATE OF username, email ON users BEGIN "
+    "UPDATE user_search SET username = new.username, email = new.email WHERE rowid = new.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_users_ad AFTER DELETE ON users BEGIN "
+    "DELETE FROM user_search WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_profiles_ai AFTER INSERT ON user_profiles BEGIN "
+    "UPDATE user_search SET bio = new.bio WHERE rowid = new.user_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_profiles_au AFTER UPDATE OF bio ON user_profiles BEGIN "
+    "UPDATE user_search SET bio = new.bio WHERE rowid = new.user_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_profiles_ad AFTER DELETE ON user_profiles BEGIN "
+    "UPDATE user_search SET bio = NULL WHERE rowid = old.user_id; "
+    "END",
+]
+
+async def create_user_search_index(conn) -> None:
+    """
+    创建全文索引和同步触发器，并从现有数据构建索引（数据库迁移中调用）
+    SQLite 不支持 FTS5 trigram 时跳过，用户搜索退化为 LIKE
+    :param conn: 异步数据库连接
+    """
+    result = await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+    )
+    exists = result.first() is not None
+    try:
+        for statement in USER_SEARCH_DDL:
+            await conn.execute(text(statement))
+    except OperationalError as e:
+        print(f"当前SQLite不支持FTS5 trigram，跳过创建用户全文索引: {e}")
+        return
+
+    if not exists:
+        await conn.execute(text(
+            "INSERT INTO user_search(rowid, username, email, bio) "
+            "SELECT users.id, users.username, users.email, user_profiles.bio "
+            "FROM users LEFT JOIN user_profiles ON user_profiles.user_id = users.id"
+        ))
+
+def _escape_like(value: str) -> str:
+    """转义 LIKE 通配符"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class UserSearchIndex:
+    """用户搜索索引"""
+
+    def __init__(self):
+        # 当前SQLite是否支持 FTS5 trigram 分词器
+        self.available = False
+
+    async def check(self, conn) -> None:
+        """
+        检查全文索引是否可用（启动时调用）
+        :param conn: 异步数据库连接
+        """
+        result = await conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+        )
+        self.available = result.first() is not None
+        if not self.available:
+            print("用户全文索引不可用，用户搜索将使用LIKE")
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0
+    ) -> List[Tuple[User, UserProfile]]:
+        """
+        搜索用户，结果按相关度排序，用户名前缀匹配的结果排在最前
+        :param db: 数据库会话
+        :param query: 搜索关键词
+        :param limit: 返回数量
+        :param offset: 跳过的结果数
+        :return: (用户, 用户资料) 列表
+        """
+        if len(query) < MIN_FTS_QUERY_LENGTH:
+            return await self._search_prefix(db, query, limit, offset)
+        if not self.available:
+            return await self._search_like(db, query, limit, offset)
+
+        # 整体作为一个短语查询，trigram 分词下即子串匹配
+        match = '"' + query.replace('"', '""') + '"'
+        result = await db.execute(
+            text(
+                "SELECT rowid FROM user_search WHERE user_search MATCH :match "
+                "ORDER BY (username LIKE :prefix ESCAPE '\\') DESC, "
+                "bm25(user_search, 10.0, 5.0, 1.0), rowid "
+                "LIMIT :limit OFFSET :offset"
+            ),
+            {"match": match, "prefix": _escape_like(query) + "%", "limit": limit, "offset": offset}
+        )
+        user_ids = list(result.scalars())
+        if not user_ids:
+            return []
+
+        result = await db.execute(
+            select(User, UserProfile)
+            .outerjoin(UserProfile)
+            .where(User.id.in_(user_ids))
+        )
+        rows = {user.id: (user, profile) for user, profile in result.all()}
+        return [rows[user_id] for user_id in user_ids if user_id in rows]
+
+    async def _search_prefix(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int
+    ) -> List[Tuple[User, UserProfile]]:
+        """短关键词：按用户名或邮箱前缀做索引范围查询"""
+        upper = query + "\U0010ffff"
+        normalized = query.lower()
+        result = await db.execute(
+            select(User, UserProfile)
+            .outerjoin(UserProfile)
+            .where(
+                or_(
+                    (User.username >= query) & (User.username < upper),
+                    (User.email_normalized >= normalized) & (User.email_normalized < normalized + "\U0010ffff")
+                )
+            )
+            .order_by(User.username, User.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return result.all()
+
+    async def _search_like(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int
+    ) -> List[Tuple[User, UserProfile]]:
+        """不支持全文索引时的回退方案"""
+        pattern = f"%{_escape_like(query)}%"
+        result = await db.execute(
+            select(User, UserProfile)
+            .outerjoin(UserProfile)
+            .where(
+                or_(
+                    User.username.ilike(pattern, escape="\\"),
+                    User.email.ilike(pattern, escape="\\")
+                )
+            )
+            .order_by(User.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return result.all()
+
+# 创建全局用户搜索索引实例
+user_search = UserSearchIndex()
@@ -0,0 +1,247 @@
+"""
+验证码存储模块
+提供带过期时间、尝试次数限制和容量上限的验证码存储，支持内存和SQLite两种后端
+"""
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from config import (
+    VERIFICATION_BACKEND,
+    VERIFICATION_DB_PATH,
+    VERIFICATION_CODE_TTL_SECONDS,
+    VERIFICATION_MAX_ATTEMPTS,
+    VERIFICATION_MAX_ENTRIES,
+)
+
+class VerificationBackend:
+    """验证码存储后端基类"""
+
+    # 会阻塞的后端提供执行器，存储在其中调用后端方法，避免阻塞事件循环
+    executor: Optional[ThreadPoolExecutor] = None
+
+    def set(self, email: str, code: str, expires_at: float) -> None:
+        """保存验证码（覆盖旧验证码并重置尝试次数）"""
+        raise NotImplementedError
+
+    def get(self, email: str) -> Optional[Dict]:
+        """获取未过期的验证码记录: {"code", "expires_at", "attempts"}"""
+        raise NotImplementedError
+
+    def incr_attempts(self, email: str) -> int:
+        """增加失败尝试次数并返回新的次数"""
+        raise NotImplementedError
+
+    def delete(self, email: str) -> None:
+        """删除验证码"""
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """当前存储的验证码数量"""
+        raise NotImplementedError
+
+class MemoryVerificationBackend(VerificationBackend):
+    """进程内存后端，使用时间轮按秒批量清理过期验证码"""
+
+    def __init__(self, max_entries: int = VERIFICATION_MAX_ENTRIES, wheel_size: int = 64):
+        self.max_entries = max_entries
+        # 邮箱到验证码记录的映射，按写入顺序排列，超出容量时淘汰最早的记录
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # 时间轮: 每个槽位存放在对应秒过期的邮箱
+        self._wheel: List[Set[str]] = [set() for _ in range(wheel_size)]
+        self._current_tick = int(time.time())
+
+    def _advance(self) -> None:
+        """推进时间轮，清理已经过期的验证码"""
+        now_tick = int(time.time())
+        if now_tick <= self._current_tick:
+            return
+
+        # 间隔超过一整圈时，每个槽位只需检查一次
+        steps = min(now_tick - self._current_tick, len(self._wheel))
+        for offset in range(1, steps + 1):
+            slot = self._wheel[(self._current_tick + offset) % len(self._wheel)]
+            for email in list(slot):
+                entry = self._entries.get(email)
+                if entry is None or entry["expires_at"] <= now_tick:
+                    slot.discard(email)
+                    if entry is not None:
+                        del self._entries[email]
+        self._current_tick = now_tick
+
+    def set(self, email: str, code: str, expires_at: float) -> None:
+        self._advance()
+        self._entries.pop(email, None)
+        self._entries[email] = {"code": code, "expires_at": expires_at, "attempts": 0}
+        # 放入过期时刻之后的第一个整秒槽位，保证轮到该槽位时已经过期
+        self._wheel[(int(expires_at) + 1) % len(self._wheel)].add(email)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, email: str) -> Optional[Dict]:
+        self._advance()
+        entry = self._entries.get(email)
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+        return dict(entry)
+
+    def incr_attempts(self, email: str) -> int:
+        entry = self._entries.get(email)
+        if entry is None:
+            return 0
+        entry["attempts"] += 1
+        return entry["attempts"]
+
+    def delete(self, email: str) -> None:
+        self._entries.pop(email, None)
+
+    def size(self) -> int:
+        self._advance()
+        return len(self._entries)
+
+class SQLiteVerificationBackend(VerificationBackend):
+    """SQLite文件后端，多个uvicorn工作进程可共享同一个文件"""
+
+    def __init__(self, path: str = VERIFICATION_DB_PATH, max_entries: int = VERIFICATION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # sqlite3 是阻塞的（文件被其他进程锁住时最多等待5秒），所有数据库操作都在这个单线程执行器中完成
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="verification")
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verification_codes ("
+            "email TEXT PRIMARY KEY, code TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_verification_codes_expires_at "
+            "ON verification_codes (expires_at)"
+        )
+
+    def set(self, email: str, code: str, expires_at: float) -> None:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM verification_codes WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verification_codes "
+                "(email, code, expires_at, attempts, created_at) VALUES (?, ?, ?, 0, ?)",
+                (email, code, expires_at, now)
+            )
+            # 超出容量时淘汰最早写入的记录
+            self._conn.execute(
+                "DELETE FROM verification_codes WHERE email IN ("
+                "SELECT email FROM verification_codes ORDER BY created_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def get(self, email: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT code, expires_at, attempts FROM verification_codes "
+            "WHERE email = ? AND expires_at > ?",
+            (email, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return {"code": row[0], "expires_at": row[1], "attempts": row[2]}
+
+    def incr_attempts(self, email: str) -> int:
+        row = self._conn.execute(
+            "UPDATE verification_codes SET attempts = attempts + 1 "
+            "WHERE email = ? RETURNING attempts",
+            (email,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, email: str) -> None:
+        self._conn.execute("DELETE FROM verification_codes WHERE email = ?", (email,))
+
+    def size(self) -> int:
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM verification_codes WHERE expires_at > ?",
+            (time.time(),)
+        ).fetchone()
+        return row[0]
+
+class VerificationCodeStore:
+    """验证码存储，负责过期时间和失败尝试次数的控制"""
+
+    def __init__(
+        self,
+        backend: VerificationBackend,
+        ttl: int = VERIFICATION_CODE_TTL_SECONDS,
+        max_attempts: int = VERIFICATION_MAX_ATTEMPTS
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    async def _call(self, method: Callable, *args):
+        """调用后端方法，会阻塞的后端在其执行器中调用"""
+        if self.backend.executor is None:
+            return method(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.backend.executor, method, *args)
+
+    async def issue(self, email: str, code: str) -> None:
+        """
+        保存新生成的验证码
+        :param email: 用户邮箱
+        :param code: 验证码
+        """
+        await self._call(self.backend.set, email, code, time.time() + self.ttl)
+
+    async def verify(self, email: str, code: str) -> bool:
+        """
+        校验验证码，失败次数达到上限后验证码作废
+        :param email: 用户邮箱
+        :param code: 用户提供的验证码
+        :return: 验证码是否有效
+        """
+        entry = await self._call(self.backend.get, email)
+        if entry is None:
+            return False
+        if entry["code"] == code:
+            return True
+
+        if await self._call(self.backend.incr_attempts, email) >= self.max_attempts:
+            await self._call(self.backend.delete, email)
+        return False
+
+    async def clear(self, email: str) -> None:
+        """
+        清理验证码
+        :param email: 用户邮箱
+        """
+        await self._call(self.backend.delete, email)
+
+    async def stats(self) -> Dict:
+        """获取验证码存储统计"""
+        return {
+            "backend": type(self.backend).__name__,
+            "size": await self._call(self.backend.size),
+            "ttl": self.ttl,
+            "max_attempts": self.max_attempts
+        }
+
+def create_verification_store() -> VerificationCodeStore:
+    """根据配置创建验证码存储"""
+    if VERIFICATION_BACKEND == "sqlite":
+        backend = SQLiteVerificationBackend()
+    elif VERIFICATION_BACKEND == "memory":
+        backend = MemoryVerificationBackend()
+    else:
+        raise ValueError(f"不支持的验证码存储后端: {VERIFICATION_BACKEND}")
+    return VerificationCodeStore(backend)
+
+# 创建全局验证码存储实例
+verification_store = create_verification_store()
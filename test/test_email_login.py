@@ -0,0 +1,70 @@
+"""
+邮箱登录回归测试
+旧数据库中允许存在仅大小写或空白不同的邮箱，回填规范化邮箱后两个用户都必须能用各自的邮箱登录
+运行: python -m pytest test/test_email_login.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# 使用临时数据库，必须在导入 models 之前设置
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from migrations import run_migrations
+from models import async_engine, backfill_email_normalized
+from routes import auth_router
+from services import password_hasher
+
+LEGACY_USERS = [
+    ("foo1", "Foo@x.com", "password-1"),
+    ("foo2", "foo@x.com", "password-2"),
+]
+
+async def _seed_legacy_users() -> None:
+    """写入规范化邮箱为空的旧用户，再执行回填"""
+    async with async_engine.begin() as conn:
+        await run_migrations(conn)
+        for username, email, password in LEGACY_USERS:
+            await conn.execute(
+                text(
+                    "INSERT INTO users (username, email, hashed_password, is_active, is_online, create_at) "
+                    "VALUES (:username, :email, :hashed_password, 1, 0, :create_at)"
+                ),
+                {
+                    "username": username,
+                    "email": email,
+                    "hashed_password": await password_hasher.hash(password),
+                    "create_at": datetime.now(timezone.utc),
+                }
+            )
+        await backfill_email_normalized(conn)
+    await async_engine.dispose()
+
+@pytest.fixture(scope="module")
+def client():
+    asyncio.run(_seed_legacy_users())
+    app = FastAPI()
+    app.include_router(auth_router, prefix="/api/v1")
+    with TestClient(app) as test_client:
+        yield test_client
+    password_hasher.shutdown()
+
+@pytest.mark.parametrize("username,email,password", LEGACY_USERS)
+def test_login_with_case_colliding_legacy_email(client, username, email, password):
+    response = client.post("/api/v1/token", json={"email": email, "password": password})
+    assert response.status_code == 200, response.json()
+    assert response.json()["user"]["username"] == username
+
+def test_login_with_normalized_email_resolves_backfilled_user(client):
+    response = client.post("/api/v1/token", json={"email": " FOO@X.COM ", "password": "password-1"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["user"]["username"] == "foo1"
@@ -0,0 +1,69 @@
+/**
+ * WebSocket 实时推送测试客户端
+ * 用法: node test/websocket.js <access_token> [服务地址，默认 ws://127.0.0.1:8000]
+ * Node 22 及以上自带 WebSocket，更早的版本需先安装: npm install ws
+ */
+const WebSocketClient = globalThis.WebSocket || require("ws");
+
+const token = process.argv[2];
+const baseUrl = process.argv[3] || "ws://127.0.0.1:8000";
+if (!token) {
+    console.error("用法: node test/websocket.js <access_token> [ws://host:port]");
+    process.exit(1);
+}
+
+// 服务端心跳有效期为 PRESENCE_TTL_SECONDS（默认120秒），定期发送 ping 保持在线
+const PING_INTERVAL_MS = 30000;
+// 被服务端断开后的重连延迟（慢速连接会以 1013 关闭，重连后应通过接口补齐数据）
+const RECONNECT_DELAY_MS = 3000;
+
+function connect() {
+    const url = `${baseUrl}/api/v1/ws?token=${encodeURIComponent(token)}`;
+    const ws = new WebSocketClient(url);
+    let pingTimer = null;
+
+    ws.onopen = () => {
+        console.log("已连接", url);
+        pingTimer = setInterval(() => ws.send(JSON.stringify({ type: "ping" })), PING_INTERVAL_MS);
+    };
+
+    ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        switch (data.type) {
+            case "ready":
+                console.log("认证成功，用户ID:", data.user_id);
+                break;
+            case "message.new":
+                console.log(`[会话${data.conversation_id}] ${data.message.sender.username}: ${data.message.content}`);
+                break;
+            case "message.read":
+                console.log(`[会话${data.conversation_id}] 用户${data.reader_id} 已读到消息${data.last_read_message_id}`);
+                break;
+            case "message.recalled":
+                console.log(`[会话${data.conversation_id}] 消息${data.message_id} 已撤回`);
+                break;
+            case "conversation.cleared":
+                console.log(`[会话${data.conversation_id}] 聊天记录已被清空`);
+                break;
+            case "pong":
+                break;
+            default:
+                console.log("未知事件", data);
+        }
+    };
+
+    ws.onclose = (event) => {
+        clearInterval(pingTimer);
+        console.log("连接已关闭", event.code, event.reason);
+        // 1008: 令牌无效、已过期或已登出，需要重新登录，不再重连
+        if (event.code !== 1008) {
+            setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+    };
+
+    ws.onerror = (event) => {
+        console.error("连接错误", event.message || event);
+    };
+}
+
+connect();